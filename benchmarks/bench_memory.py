@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+########################################################################################################################
+#
+# Measures how much memory each processed commit holds on to, comparing the original CommitData namedtuples with the
+# CommitRecord objects now produced by process_raw_commit. Results are printed as json.
+#
+########################################################################################################################
+import argparse
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import commit_report
+
+MESSAGE = ('[SWTI-{issue}] Rework the widget cache for release {commit}\n\n'
+           'The cache now keeps entries per tenant instead of globally, see the design notes\n'
+           'attached to the issue for details.\n')
+
+
+def make_raw_commit(index: int) -> commit_report.RawCommit:
+    """
+    Build a RawCommit as the git-log backend would read it
+    :param index: Position of the commit, used to vary the fields
+    :return: RawCommit object
+    """
+    return commit_report.RawCommit(binsha=index.to_bytes(20, 'big'),
+                                   author='Author {}'.format(index % 50).encode('utf-8'),
+                                   authored_date=1493704132 + index,
+                                   author_tz_offset=14400,
+                                   message=MESSAGE.format(issue=index % 1000, commit=index).encode('utf-8'))
+
+
+def process_as_commit_data(raw: commit_report.RawCommit, include_links: bool,
+                           issue_matcher: commit_report.IssueMatcher) -> commit_report.CommitData:
+    """
+    Process a commit the way it was done before CommitRecord, decoding and formatting every field up front
+    :param raw: The commit being worked on
+    :param include_links: Extract issues as well
+    :param issue_matcher: Compiled issue trackers
+    :return: CommitData object
+    """
+    message = commit_report.decode_text(raw.message)
+    issues = commit_report.find_issues(issue_matcher, message) if include_links else []
+    return commit_report.CommitData(id=raw.binsha.hex(),
+                                    author=commit_report.decode_text(raw.author),
+                                    timestamp=commit_report.format_timestamp(raw.authored_date, raw.author_tz_offset),
+                                    messages=message,
+                                    issues=issues)
+
+
+def bytes_per_commit(process, commits: int, include_links: bool) -> float:
+    """
+    Process synthetic commits, keeping every result, and measure the memory allocated
+    :param process: Function taking a RawCommit, include_links and an IssueMatcher
+    :param commits: Number of commits
+    :param include_links: Extract issues as well
+    :return: Bytes held per processed commit
+    """
+    issue_matcher = commit_report.build_issue_matcher()
+    tracemalloc.start()
+    kept = [process(make_raw_commit(index), include_links, issue_matcher) for index in range(commits)]
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return current / commits
+
+
+def main(args: [str]):
+    parser = argparse.ArgumentParser(description='Per commit memory footprint of processed commits')
+    parser.add_argument('--commits', type=int, default=100000, help='Number of commits (Default: "%(default)s")')
+    parser.add_argument('--issue-links', dest='links', action='store_true', default=False,
+                        help='Extract issues as well')
+    parsed_args = parser.parse_args(args)
+
+    results = {'commits': parsed_args.commits,
+               'issue_links': parsed_args.links,
+               'commit_data_bytes_per_commit': bytes_per_commit(process_as_commit_data, parsed_args.commits,
+                                                                parsed_args.links),
+               'commit_record_bytes_per_commit': bytes_per_commit(commit_report.process_raw_commit,
+                                                                  parsed_args.commits, parsed_args.links)}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+########################################################################################################################
+#
+# Benchmarks each stage of a report against synthetic repositories generated locally with git fast-import, so it runs
+# without network access or the git-server container. Results are printed as json for tracking across versions.
+#
+# Example: python benchmarks/bench_report.py --commits 10000 100000 --output results.json
+#
+########################################################################################################################
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import commit_report
+
+DEFAULT_COMMITS = [10000]
+DEFAULT_MESSAGE_LINES = 5
+DEFAULT_ISSUES_PER_MESSAGE = 3
+DEFAULT_MERGE_EVERY = 10
+# Commits touch one of this many directories, giving path filtered reports something to select
+DIRECTORIES = 10
+START_TAG = 'bench-start'
+# Branch moved by the incremental benchmark to grow its range
+INCREMENTAL_REF = 'refs/heads/bench-incremental'
+
+
+def commit_message(index: int, lines: int, issues: int) -> bytes:
+    """
+    :param index: Position of the commit
+    :param lines: Number of lines in the message
+    :param issues: Number of issue ids mentioned
+    :return: Synthetic commit message
+    """
+    subject = 'Commit {} {}'.format(index, ' '.join('[BENCH-{}]'.format((index + issue) % 5000)
+                                                    for issue in range(issues)))
+    body = ['Line {} of the description of change {}, long enough to look like a real message body.'.format(
+        line, index) for line in range(1, lines)]
+    return '\n'.join([subject] + body).encode('utf-8') + b'\n'
+
+
+def fast_import_stream(commits: int, message_lines: int, issues: int, merge_every: int):
+    """
+    Generate a git fast-import stream describing a synthetic history
+    :param commits: Number of commits on the main line
+    :param message_lines: Lines per commit message
+    :param issues: Issue ids per commit message
+    :param merge_every: Every this many commits a side branch commit is merged in, 0 for a linear history
+    :return: Generator of bytes
+    """
+    mark = 0
+    previous = None
+    for index in range(commits):
+        timestamp = 1493704132 + index * 60
+        merge = None
+        if merge_every and previous is not None and index % merge_every == 0:
+            mark += 1
+            merge = mark
+            yield _commit_block(mark, 'refs/heads/side', timestamp - 30, 'Side ' + str(index), previous,
+                                commit_message(index, message_lines, issues), index)
+        mark += 1
+        yield _commit_block(mark, 'refs/heads/master', timestamp, 'Author ' + str(index % 50), previous,
+                            commit_message(index, message_lines, issues), index, merge)
+        if previous is None:
+            yield 'reset refs/tags/{}\nfrom :{}\n\n'.format(START_TAG, mark).encode('ascii')
+        previous = mark
+
+
+def _commit_block(mark: int, ref: str, timestamp: int, author: str, parent, message: bytes, index: int,
+                  merge=None) -> bytes:
+    lines = ['commit ' + ref,
+             'mark :{}'.format(mark),
+             'author {0} <{0}@example.com> {1} -0400'.format(author.replace(' ', '.'), timestamp),
+             'committer {0} <{0}@example.com> {1} -0400'.format(author.replace(' ', '.'), timestamp),
+             'data {}'.format(len(message))]
+    block = '\n'.join(lines).encode('utf-8') + b'\n' + message
+    tail = []
+    if parent is not None:
+        tail.append('from :{}'.format(parent))
+    if merge is not None:
+        tail.append('merge :{}'.format(merge))
+    content = 'change {}\n'.format(mark)
+    tail.append('M 644 inline dir{}/file.txt'.format(index % DIRECTORIES))
+    tail.append('data {}'.format(len(content)))
+    return block + '\n'.join(tail).encode('ascii') + b'\n' + content.encode('ascii') + b'\n'
+
+
+def create_repo(path: str, commits: int, message_lines: int, issues: int, merge_every: int) -> str:
+    """
+    Create a bare synthetic repo, or reuse one created earlier with the same parameters
+    :param path: Directory holding generated repos
+    :param commits: Number of commits on the main line
+    :param message_lines: Lines per commit message
+    :param issues: Issue ids per commit message
+    :param merge_every: Every this many commits a side branch commit is merged in, 0 for a linear history
+    :return: Path of the repo
+    """
+    repo_path = os.path.join(path, 'bench-{}-{}-{}-{}.git'.format(commits, message_lines, issues, merge_every))
+    if os.path.isdir(repo_path):
+        return repo_path
+    subprocess.check_call(['git', 'init', '--quiet', '--bare', repo_path])
+    proc = subprocess.Popen(['git', 'fast-import', '--quiet'], cwd=repo_path, stdin=subprocess.PIPE)
+    for chunk in fast_import_stream(commits, message_lines, issues, merge_every):
+        proc.stdin.write(chunk)
+    proc.stdin.close()
+    if proc.wait() != 0:
+        raise RuntimeError('git fast-import failed for ' + repo_path)
+    return repo_path
+
+
+class NullWriter:
+    """
+    File like object discarding everything, so formatting can be timed apart from output
+    """
+
+    def write(self, text):
+        return len(text)
+
+
+def timed(results: dict, stage: str, func, *args):
+    """
+    Run a function and record its wall time under a stage name
+    :param results: Dict the time is stored in
+    :param stage: Name of the stage
+    :param func: Function to run with args
+    :return: The function's return value
+    """
+    started = time.perf_counter()
+    value = func(*args)
+    results[stage] = round(time.perf_counter() - started, 6)
+    return value
+
+
+def bench_repo(repo_path: str, backend: str, formatter_name: str, paths: [str] = ()) -> dict:
+    """
+    Time every stage of a report over the whole synthetic history
+    :param repo_path: Repo created by create_repo
+    :param backend: Commit backend name
+    :param formatter_name: One of human, json or ndjson
+    :param paths: Only report commits touching these paths, for example dir3/
+    :return: Dict of stage timings in seconds
+    """
+    formatter = {'human': commit_report.stream_for_humans, 'json': commit_report.stream_for_json,
+                 'ndjson': commit_report.stream_for_ndjson}[formatter_name]
+    rev = commit_report.commit_range(START_TAG, 'master')
+    rev_filter = commit_report.RevFilter(paths=tuple(paths)) if paths else None
+    stages = {}
+    repo = timed(stages, 'repo_open', commit_report.get_repo, repo_path)
+    shas = timed(stages, 'range_walk', lambda: list(commit_report.iter_range_shas(repo, rev, rev_filter)))
+    raws = timed(stages, 'commit_read', lambda: list(commit_report.COMMIT_BACKENDS[backend](repo, rev, rev_filter)))
+    timed(stages, 'commit_processing', lambda: [commit_report.process_raw_commit(raw, False) for raw in raws])
+    matcher = commit_report.build_issue_matcher()
+    timed(stages, 'issue_extraction',
+          lambda: [commit_report.find_issues(matcher, commit_report.decode_text(raw.message)) for raw in raws])
+    records = [commit_report.process_raw_commit(raw, True, matcher) for raw in raws]
+    chunks = timed(stages, 'formatting', lambda: list(formatter(records, True, commit_report.DEFAULT_LINK_TEMPLATE)))
+    with open(os.devnull, 'w') as devnull:
+        timed(stages, 'output', commit_report.write_output, chunks, devnull)
+    return {'commits': len(shas),
+            'seconds': stages,
+            'commits_per_second': round(len(shas) / max(sum(stages.values()), 1e-9))}
+
+
+def bench_incremental(repo_path: str, backend: str, new_commits: int, checkpoint_dir: str,
+                      paths: [str] = ()) -> dict:
+    """
+    Time --incremental reports on a range which grew by new_commits since its checkpoint, against a plain walk
+    :param repo_path: Repo created by create_repo
+    :param backend: Commit backend name
+    :param new_commits: Main line commits added to the range after the checkpoint was made
+    :param checkpoint_dir: Directory the checkpoint database is created in
+    :param paths: Only report commits touching these paths, for example dir3/
+    :return: Dict of timings in seconds
+    """
+    rev_filter = commit_report.RevFilter(paths=tuple(paths)) if paths else None
+    repo = commit_report.get_repo(repo_path)
+    checkpoints = os.path.join(checkpoint_dir, 'checkpoints-{}.sqlite'.format(os.path.basename(repo_path)))
+    if os.path.exists(checkpoints):
+        os.remove(checkpoints)
+
+    def walk(rev):
+        return commit_report.COMMIT_BACKENDS[backend](repo, rev, rev_filter)
+
+    def report():
+        return len(list(commit_report.iter_commits_incremental(repo, repo_path, START_TAG, INCREMENTAL_REF, walk,
+                                                               checkpoints, rev_filter)))
+
+    stages = {}
+    timed(stages, 'full_walk', lambda: list(walk(commit_report.commit_range(START_TAG, 'master'))))
+    repo.git.update_ref(INCREMENTAL_REF, 'master~{}'.format(new_commits))
+    timed(stages, 'checkpoint_created', report)
+    repo.git.update_ref(INCREMENTAL_REF, 'master')
+    commits = timed(stages, 'end_moved', report)
+    timed(stages, 'end_unchanged', report)
+    commit_report.close_repo(repo)
+    return {'commits': commits, 'new_commits': new_commits, 'seconds': stages}
+
+
+def main(args: [str]):
+    parser = argparse.ArgumentParser(description='Benchmark report stages against synthetic repos')
+    parser.add_argument('--commits', type=int, nargs='+', default=DEFAULT_COMMITS,
+                        help='Main line commits of each synthetic repo (Default: "%(default)s")')
+    parser.add_argument('--message-lines', type=int, default=DEFAULT_MESSAGE_LINES,
+                        help='Lines per commit message (Default: "%(default)s")')
+    parser.add_argument('--issues-per-message', type=int, default=DEFAULT_ISSUES_PER_MESSAGE,
+                        help='Issue ids per commit message (Default: "%(default)s")')
+    parser.add_argument('--merge-every', type=int, default=DEFAULT_MERGE_EVERY,
+                        help='Merge a side commit every this many commits, 0 for linear history '
+                             '(Default: "%(default)s")')
+    parser.add_argument('--backend', choices=sorted(commit_report.COMMIT_BACKENDS),
+                        default=commit_report.DEFAULT_BACKEND, help='Commit backend (Default: "%(default)s")')
+    parser.add_argument('--format', dest='formatter', choices=['human', 'json', 'ndjson'], default='json',
+                        help='Report format (Default: "%(default)s")')
+    parser.add_argument('--path', dest='paths', action='append', default=[],
+                        help='Only report commits touching this path, for example dir3/. May be repeated.')
+    parser.add_argument('--commit-graph', action='store_true', default=False,
+                        help='Write a commit-graph in each synthetic repo, as done for cached remote repos')
+    parser.add_argument('--incremental', type=int, default=None, metavar='NEW_COMMITS',
+                        help='Also time --incremental reports on a range grown by this many main line commits since '
+                             'its checkpoint')
+    parser.add_argument('--repo-dir', default=None,
+                        help='Keep generated repos here and reuse them on later runs (Default: a temporary directory)')
+    parser.add_argument('--output', default=None, help='Write results to this file instead of stdout')
+    parsed_args = parser.parse_args(args)
+
+    git_version = subprocess.check_output(['git', '--version']).decode('ascii').strip()
+    results = {'python': platform.python_version(),
+               'git': git_version,
+               'backend': parsed_args.backend,
+               'format': parsed_args.formatter,
+               'commit_graph': parsed_args.commit_graph,
+               'paths': parsed_args.paths,
+               'runs': []}
+    with tempfile.TemporaryDirectory() as tmp:
+        repo_dir = parsed_args.repo_dir or tmp
+        os.makedirs(repo_dir, exist_ok=True)
+        for commits in parsed_args.commits:
+            run = {'main_line_commits': commits,
+                   'message_lines': parsed_args.message_lines,
+                   'issues_per_message': parsed_args.issues_per_message,
+                   'merge_every': parsed_args.merge_every}
+            repo_path = timed(run, 'generate_seconds', create_repo, repo_dir, commits, parsed_args.message_lines,
+                              parsed_args.issues_per_message, parsed_args.merge_every)
+            if parsed_args.commit_graph:
+                timed(run, 'commit_graph_seconds', commit_report.write_commit_graph,
+                      commit_report.get_repo(repo_path))
+            run.update(bench_repo(repo_path, parsed_args.backend, parsed_args.formatter, parsed_args.paths))
+            if parsed_args.incremental is not None:
+                run['incremental'] = bench_incremental(repo_path, parsed_args.backend, parsed_args.incremental, tmp,
+                                                       parsed_args.paths)
+            results['runs'].append(run)
+
+    output = json.dumps(results, indent=2)
+    if parsed_args.output:
+        with open(parsed_args.output, 'w') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
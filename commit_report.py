@@ -11,106 +11,1673 @@
 ########################################################################################################################
 import argparse
 import base64
+import codecs
+import io
 import os
 import json
+import shutil
+import tempfile
+import threading
 import traceback
-from collections import namedtuple
+from collections import deque, namedtuple, OrderedDict
+from contextlib import contextmanager, redirect_stderr
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from urllib.parse import parse_qs, urlparse
 from sys import argv
 import re
+import subprocess
 import sys
-from git import Repo, Commit
+import time
+from typing import TYPE_CHECKING
+# GitPython, pyarrow, sqlite3 and the server and process pool modules are slow to import and not needed for every
+# command, --help or an argument error, so they are imported by the functions using them
+if TYPE_CHECKING:
+    import sqlite3
+    from git import Commit, Repo
 
-# Holds processed commit information
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+try:
+    import fcntl
+except ImportError:  # Windows, the cache is not locked
+    fcntl = None
+
+try:
+    import resource
+except ImportError:  # Windows, peak memory is not reported
+    resource = None
+
+# Holds processed commit information, already formatted. Formatters accept these as well as CommitRecord objects.
 CommitData = namedtuple('CommitData', 'id, author, timestamp, messages, issues')
-# Holds processed issue information
-IssueData = namedtuple('IssueData', 'id display')
+# Holds processed issue information. A link_template of None means the report's link template is used.
+IssueData = namedtuple('IssueData', 'id display link_template')
+IssueData.__new__.__defaults__ = (None,)
+# Describes an issue tracker, the regex finding its issues in messages and the template used to link to them
+IssueTracker = namedtuple('IssueTracker', 'name pattern link_template')
+# Holds a set of issue trackers compiled for matching, see compile_issue_matcher
+IssueMatcher = namedtuple('IssueMatcher', 'regex trackers prefilters')
+# Holds the unprocessed fields of a commit as read from a commit source. author_tz_offset is in seconds west of UTC,
+# the same convention GitPython uses. author and message are either str or utf-8 bytes.
+RawCommit = namedtuple('RawCommit', 'binsha author authored_date author_tz_offset message')
+# Limits a walk to the commits of a range touching some paths, by some authors or with matching messages. merges is
+# True for only merge commits, False for no merge commits and None for both. Applied by git, see rev_filter_args.
+RevFilter = namedtuple('RevFilter', 'paths authors grep merges')
+RevFilter.__new__.__defaults__ = ((), (), (), None)
 
 DEFAULT_ISSUE_ID_MATCHER = '(?P<display>\[(?P<id>[^]]+)\])'
 DEFAULT_LINK_TEMPLATE = '{display} : https://jira.com/browse/{id}'
 DEFAULT_CACHE_DIR = ".cache/"
+DEFAULT_BACKEND = 'git-log'
+# Remote repos are cached as bare clones without file contents, only commits and trees are needed for reports
+DEFAULT_CLONE_FILTER = 'blob:none'
+PARTIAL_CLONE_GIT_VERSION = (2, 19)
+# Cached repos keep a split commit-graph, its generation numbers let git stop range walks early instead of reading both
+# ancestries to the root. Bloom filters of changed paths need a newer git.
+COMMIT_GRAPH_GIT_VERSION = (2, 24)
+CHANGED_PATHS_GIT_VERSION = (2, 27)
+# Revisions after --end-of-options are never taken as options, even when they start with '-'
+END_OF_OPTIONS_GIT_VERSION = (2, 24)
+# Forks and mirrors of a project borrow objects from one shared store, which keeps the refs of each of them under
+# SHARED_REFS_PREFIX so it never drops objects a cached repo still uses
+DEFAULT_SHARED_OBJECTS_DIR = DEFAULT_CACHE_DIR + 'shared/'
+SHARED_REFS_PREFIX = 'refs/members/'
+# Every fetch leaves a pack in the shared store, past this many they are repacked into one
+SHARED_STORE_PACK_LIMIT = 20
+# Branches are mirrored as local branches and, for ranges written against a normal clone, as origin/ branches
+CACHE_FETCH_REFSPECS = ('+refs/heads/*:refs/heads/*', '+refs/heads/*:refs/remotes/origin/*')
+FULL_SHA = re.compile('^[0-9a-f]{40}$', re.IGNORECASE)
+# File in a cached repo's git dir whose modification time records the last fetch of every ref
+FETCH_STAMP = 'commit-report-fetched'
+# File in a cached repo's git dir recording when each branch or tag was last fetched on its own, as json
+FETCH_REF_STAMPS = 'commit-report-fetched-refs'
+DEFAULT_FETCH_TTL = 0  # Seconds
+DEFAULT_FETCH_TIMEOUT = 0  # Seconds, 0 for no limit
+DEFAULT_BATCH_OUTPUT_DIR = 'reports/'
+DEFAULT_FETCH_WORKERS = 8
+# Output formats a batch job may ask for, and the extension of the file it is written to
+BATCH_FORMATS = {'human': 'txt', 'json': 'json', 'ndjson': 'ndjson', 'arrow': 'arrow'}
+DEFAULT_SERVE_HOST = '127.0.0.1'
+DEFAULT_SERVE_PORT = 8000
+DEFAULT_REPO_POOL_SIZE = 16
+# Backends which only run git processes of their own, so reports using them can share a repo handle. The others read
+# objects through the handle's cat-file processes one report at a time.
+CONCURRENT_BACKENDS = ('git-log',)
+# Content type of each report format served by the serve command
+SERVE_CONTENT_TYPES = {'human': 'text/plain; charset=utf-8', 'json': 'application/json',
+                       'ndjson': 'application/x-ndjson', 'arrow': 'application/vnd.apache.arrow.stream'}
+# Fields requested from 'git log', NUL separated. With -z each record is also NUL terminated.
+GIT_LOG_FORMAT = '%H%x00%an%x00%ad%x00%B'
+GIT_LOG_FIELDS = 4
+GIT_LOG_READ_SIZE = 64 * 1024
+DEFAULT_METADATA_CACHE = DEFAULT_CACHE_DIR + 'metadata.sqlite'
+DEFAULT_METADATA_CACHE_SIZE = 256  # Megabytes
+# Backends using the metadata cache unless told otherwise. Listing the range and reading the missing commits costs
+# more than one 'git log' walk, so only the slower GitPython backend gains from it.
+METADATA_CACHE_BACKENDS = ('gitpython',)
+DEFAULT_CHECKPOINTS = DEFAULT_CACHE_DIR + 'checkpoints.sqlite'
+# Number of commits looked up in the metadata cache at a time, kept below SQLite's bound parameter limit
+METADATA_CACHE_BATCH = 500
+# Commits per record batch of --arrow output
+ARROW_BATCH_SIZE = 10000
+DEFAULT_JOBS = 1
+# Parallel processing sizes chunks so each takes a worker about this long, enough to hide the cost of handing chunks
+# to the workers while still spreading small ranges over all of them
+CHUNK_TARGET_SECONDS = 0.1
+MIN_CHUNK_SIZE = 50
+MAX_CHUNK_SIZE = 5000
+
+
+def clone_repo(url: str, cache_path: str, clone_filter: str = DEFAULT_CLONE_FILTER,
+               shared_objects: bool = True) -> 'Repo':
+    """
+    Clone a remote repo to a local path
+    :param url: The remote repo URI
+    :param cache_path: A local filesystem path to clone to
+    :param clone_filter: Partial clone filter, for example 'blob:none' or 'tree:0'. None for a full clone.
+    :param shared_objects: Keep the objects in the shared store of the remote's project rather than in the clone
+    :return: A Repo object
+    """
+    from git import Repo
+    store = find_shared_store(url) if shared_objects else None
+    # Clone next to the final location and move it into place once complete, so a repo is either fully cloned or
+    # not there at all
+    parent = os.path.dirname(os.path.abspath(cache_path))
+    os.makedirs(parent, exist_ok=True)
+    clone_path = tempfile.mkdtemp(dir=parent, prefix='.clone-')
+    try:
+        _clone_into(url, clone_path, clone_filter, store, os.path.basename(cache_path.rstrip('/')))
+        os.rename(clone_path, cache_path)
+    except Exception:
+        shutil.rmtree(clone_path, ignore_errors=True)
+        raise
+    return Repo(cache_path)
+
+
+def _clone_into(url: str, path: str, clone_filter: str, store: str = None, name: str = None):
+    from git import Git, Repo
+    options = {'bare': True}
+    if clone_filter and Git().version_info >= PARTIAL_CLONE_GIT_VERSION:
+        options['filter'] = clone_filter
+    if store:
+        # The remote only sends the objects the store does not have yet
+        options['reference'] = os.path.abspath(store)
+    repo = Repo.clone_from(url=url, to_path=path, **options)
+    # Bare clones have no fetch refspec of their own
+    repo.git.config('--unset-all', 'remote.origin.fetch', with_exceptions=False)
+    for refspec in CACHE_FETCH_REFSPECS:
+        repo.git.config('--add', 'remote.origin.fetch', refspec)
+    # Create the origin/ branches from the just cloned branches without going back to the remote
+    branches = repo.git.for_each_ref('refs/heads/', format='%(objectname) %(refname)').splitlines()
+    proc = repo.git.update_ref('--stdin', istream=subprocess.PIPE, as_process=True)
+    proc.stdin.write(''.join('create refs/remotes/origin/{} {}\n'.format(refname[len('refs/heads/'):], sha)
+                             for sha, refname in (branch.split(' ', 1) for branch in branches)).encode('utf-8'))
+    proc.stdin.close()
+    proc.wait()
+    repo.git.config('core.commitGraph', 'true')
+    if store:
+        # Relative, so the cache directory can be moved as a whole
+        objects = os.path.join(os.path.abspath(path), 'objects')
+        with open(os.path.join(objects, 'info', 'alternates'), 'w') as alternates:
+            alternates.write(os.path.relpath(os.path.join(os.path.abspath(store), 'objects'), objects) + '\n')
+        # Fetched objects are moved to the store, a background gc must not repack them meanwhile
+        repo.git.config('gc.auto', '0')
+    store_fetched_objects(repo, name)
+    record_fetch(repo)
+    close_repo(repo)
+
+
+def find_shared_store(url: str, stores_dir: str = DEFAULT_SHARED_OBJECTS_DIR) -> str:
+    """
+    Pick the shared object store for a remote about to be cloned. Forks and mirrors of a project advertise branches
+    or tags pointing at the same commits as the refs another remote of the project keeps in the store, unrelated
+    remotes do not. Only refs are compared, looking objects up could make git fetch them in a partial clone store.
+    :param url: The remote repo URI
+    :param stores_dir: Directory holding the shared stores
+    :return: Path of the store, a new one when no store has any of the remote's commits
+    """
+    from git import Git, Repo
+    advertised = set(line.split('\t')[0] for line in Git().ls_remote(url).splitlines())
+    with repo_lock(stores_dir, exclusive=True):
+        os.makedirs(stores_dir, exist_ok=True)
+        for name in sorted(os.listdir(stores_dir)):
+            path = os.path.join(stores_dir, name)
+            if not name.startswith('.') and os.path.isdir(path) and advertised & member_tips(path):
+                return path
+        path = os.path.join(stores_dir, os.path.basename(create_cache_path(url)))
+        if not os.path.isdir(path):
+            store = Repo.init(path, bare=True)
+            store.git.config('core.commitGraph', 'true')
+            close_repo(store)
+        return path
+
+
+def member_tips(path: str) -> set:
+    """
+    :param path: Shared store
+    :return: Object ids the refs of the store's members point at
+    """
+    from git import Git
+    return set(Git(path).for_each_ref(SHARED_REFS_PREFIX, format='%(objectname)').split())
+
+
+def shared_store(repo: 'Repo'):
+    """
+    :param repo: Cached repo
+    :return: Path of the shared store the repo borrows objects from, None if it keeps its own
+    """
+    objects = os.path.join(repo.git_dir, 'objects')
+    try:
+        with open(os.path.join(objects, 'info', 'alternates')) as alternates:
+            line = alternates.readline().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.dirname(os.path.normpath(os.path.join(objects, line))) if line else None
+
+
+def share_objects(repo: 'Repo', store: str, name: str):
+    """
+    Move the objects of a cached repo into the shared store it borrows from and record its refs there. Readers of
+    other repos borrowing from the store are not disturbed, each pack's index is moved last so git never finds an
+    index without its pack and packs are only removed by git once repacked, see repack_shared_store.
+    :param repo: Cached repo, locked exclusively
+    :param store: Path of the shared store
+    :param name: Name of the repo in the cache, its refs are kept under SHARED_REFS_PREFIX + name in the store
+    :return: None
+    """
+    from git import Repo
+    objects = os.path.join(repo.git_dir, 'objects')
+    store_objects = os.path.join(store, 'objects')
+    with repo_lock(store, exclusive=True):
+        for entry in sorted(os.listdir(objects)):
+            # Loose objects, which local clones and small fetches leave behind
+            if len(entry) == 2 and os.path.isdir(os.path.join(objects, entry)):
+                os.makedirs(os.path.join(store_objects, entry), exist_ok=True)
+                for object_name in os.listdir(os.path.join(objects, entry)):
+                    _move_object_file(os.path.join(objects, entry, object_name),
+                                      os.path.join(store_objects, entry, object_name))
+        pack_files = sorted(os.listdir(os.path.join(objects, 'pack')))
+        for index in [pack_file for pack_file in pack_files if pack_file.endswith('.idx')]:
+            stem = index[:-len('idx')]
+            # The pack, its .promisor, .rev or .bitmap, then the index
+            for pack_file in [pack_file for pack_file in pack_files if pack_file.startswith(stem) and
+                              pack_file != index] + [index]:
+                _move_object_file(os.path.join(objects, 'pack', pack_file),
+                                  os.path.join(store_objects, 'pack', pack_file))
+
+        store_repo = Repo(store)
+        prefix = SHARED_REFS_PREFIX + name + '/'
+        refs = dict((prefix + refname[len('refs/'):], sha) for sha, refname in (
+            line.split(' ', 1) for line in repo.git.for_each_ref(format='%(objectname) %(refname)').splitlines()))
+        stale = set(store_repo.git.for_each_ref(prefix, format='%(refname)').splitlines()) - set(refs)
+        proc = store_repo.git.update_ref('--stdin', istream=subprocess.PIPE, as_process=True)
+        proc.stdin.write(''.join(['update {} {}\n'.format(refname, sha) for refname, sha in sorted(refs.items())] +
+                                 ['delete {}\n'.format(refname) for refname in sorted(stale)]).encode('utf-8'))
+        proc.stdin.close()
+        proc.wait()
+        repack_shared_store(store_repo)
+        write_commit_graph(store_repo)
+        close_repo(store_repo)
+
+
+def repack_shared_store(store_repo: 'Repo', pack_limit: int = SHARED_STORE_PACK_LIMIT) -> bool:
+    """
+    Repack a shared store once it holds more than pack_limit packs, as object lookups get slower with every pack. The
+    stores of partial clones hold promisor packs, whose commits and trees refer to blobs which were never fetched.
+    Marking the store as a partial clone for the repack lets git repack them without those blobs. The store has no
+    remote to fetch missing objects from, so the mark is removed again afterwards.
+    :param store_repo: Shared store, locked exclusively
+    :param pack_limit: Number of packs the store may hold before it is repacked
+    :return: True if the store was repacked
+    """
+    pack_dir = os.path.join(store_repo.git_dir, 'objects', 'pack')
+    if sum(1 for pack_file in os.listdir(pack_dir) if pack_file.endswith('.pack')) <= pack_limit:
+        return False
+    partial = store_repo.git.version_info >= PARTIAL_CLONE_GIT_VERSION
+    if partial:
+        store_repo.git.config('core.repositoryFormatVersion', '1')
+        store_repo.git.config('extensions.partialClone', 'origin')
+    try:
+        # A store which cannot be repacked is slower but still correct
+        status, _, _ = store_repo.git.gc('--quiet', with_extended_output=True, with_exceptions=False)
+    finally:
+        if partial:
+            store_repo.git.config('--unset', 'extensions.partialClone')
+    return status == 0
+
+
+def _move_object_file(path: str, destination: str):
+    # Object and pack files are named after their content, one the store already has is the same file. It may even
+    # be a hard link to it, after a local clone, which rename leaves in place.
+    if os.path.exists(destination):
+        os.remove(path)
+    else:
+        os.replace(path, destination)
+
+
+def store_fetched_objects(repo: 'Repo', name: str = None):
+    """
+    Finish off a clone or fetch of a cached repo. Its objects go to its shared store, if it has one, and the
+    commit-graph covering them is brought up to date.
+    :param repo: Cached repo, locked exclusively
+    :param name: Name of the repo in the cache, by default the name of its directory
+    :return: None
+    """
+    store = shared_store(repo)
+    if store:
+        share_objects(repo, store, name or os.path.basename(repo.git_dir.rstrip('/')))
+    else:
+        write_commit_graph(repo)
+
+
+def write_commit_graph(repo: 'Repo') -> bool:
+    """
+    Bring a cached repo's commit-graph up to date. The graph is split in layers so only the commits added since the
+    last write are processed, git merges the layers as they accumulate.
+    :param repo: Cached repo
+    :return: True if the commit-graph was written, False if git is too old or writing failed
+    """
+    version = repo.git.version_info
+    if version < COMMIT_GRAPH_GIT_VERSION:
+        return False
+    options = ['--reachable', '--split']
+    if version >= CHANGED_PATHS_GIT_VERSION:
+        options.append('--changed-paths')
+    # The graph only speeds up reports, a repo without one is still fine to use
+    status, _, _ = repo.git.commit_graph('write', *options, with_extended_output=True, with_exceptions=False)
+    return status == 0
+
+
+def record_fetch(repo: 'Repo', names: [str] = None):
+    """
+    Note that a cached repo has just been fetched
+    :param repo: Cached repo, locked exclusively
+    :param names: Branches and tags fetched, None when every ref was
+    :return: None
+    """
+    if names is None:
+        with open(os.path.join(repo.git_dir, FETCH_STAMP), 'w'):
+            pass
+        return
+    stamps = read_fetch_ref_stamps(repo)
+    stamps.update((name, time.time()) for name in names)
+    path = os.path.join(repo.git_dir, FETCH_REF_STAMPS)
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp_path, 'w') as stamps_file:
+        json.dump(stamps, stamps_file)
+    os.replace(temp_path, path)
+
+
+def read_fetch_ref_stamps(repo: 'Repo') -> dict:
+    """
+    :param repo: Cached repo
+    :return: Dict of branch or tag name to the time it was last fetched on its own
+    """
+    try:
+        with open(os.path.join(repo.git_dir, FETCH_REF_STAMPS)) as stamps_file:
+            return json.load(stamps_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def seconds_since_fetch(repo: 'Repo', name: str = None):
+    """
+    :param repo: Cached repo
+    :param name: Branch or tag, None for the last fetch of every ref
+    :return: Seconds since the repo, or the branch or tag, was last fetched, None if that is not known
+    """
+    try:
+        fetched = os.path.getmtime(os.path.join(repo.git_dir, FETCH_STAMP))
+    except OSError:
+        fetched = None
+    if name is not None:
+        ref_fetched = read_fetch_ref_stamps(repo).get(name)
+        if ref_fetched is not None and (fetched is None or ref_fetched > fetched):
+            fetched = ref_fetched
+    return None if fetched is None else time.time() - fetched
+
+
+def rev_ref_name(rev: str):
+    """
+    :param rev: Revision, for example 'origin/master~2' or 'v1.0'
+    :return: Name of the branch or tag the revision is based on, None if it is not based on one
+    """
+    name = re.split(r'[~^@:]', rev)[0]
+    if name.startswith('origin/'):
+        name = name[len('origin/'):]
+    return name if name and name != 'HEAD' else None
+
+
+def resolves_locally(repo: 'Repo', rev: str) -> bool:
+    """
+    :param repo: Repo to look in
+    :param rev: Revision
+    :return: True if the revision names a commit already present in the repo
+    """
+    return bool(repo.git.rev_parse('--verify', '--quiet', rev + '^{commit}', with_exceptions=False))
+
+
+def revs_to_fetch(repo: 'Repo', revs: [str], fetch_ttl: int = DEFAULT_FETCH_TTL):
+    """
+    Decide what a cached repo has to fetch before a report. Commits named by sha never change so they are only fetched
+    when missing. Branches and tags are fetched unless they, or every ref, were fetched less than fetch_ttl seconds
+    ago.
+    :param repo: Cached repo
+    :param revs: Revisions the report needs
+    :param fetch_ttl: How long, in seconds, fetched branches and tags are considered current
+    :return: List of revisions to fetch, empty when no fetch is needed, or None when everything should be fetched
+    """
+    if not revs:
+        return None
+    missing = []
+    for rev in revs:
+        if rev in missing:
+            continue
+        if FULL_SHA.match(rev):
+            fresh = True
+        else:
+            age = seconds_since_fetch(repo, rev_ref_name(rev))
+            fresh = age is not None and age < fetch_ttl
+        if fresh and resolves_locally(repo, rev):
+            continue
+        missing.append(rev)
+    return missing
+
+
+def targeted_refspecs(repo: 'Repo', revs: [str], timeout: float = None):
+    """
+    Work out the refspecs which fetch just what is needed to resolve some revisions
+    :param repo: Cached repo
+    :param revs: Revisions which will be used, for example the start and end of a range
+    :param timeout: Seconds after which asking the remote for its refs is given up, None for no limit
+    :return: List of refspecs, or None if the revisions cannot be mapped onto remote refs
+    """
+    refspecs = []
+    names = []
+    for rev in revs:
+        if FULL_SHA.match(rev):
+            refspecs.append(rev)
+            continue
+        name = rev_ref_name(rev)
+        if name is None:
+            return None
+        names.append(name)
+
+    if names:
+        patterns = [prefix + name for name in names for prefix in ('refs/heads/', 'refs/tags/')]
+        listing = repo.git.ls_remote('origin', *patterns, kill_after_timeout=timeout)
+        advertised = set(line.split('\t')[-1] for line in listing.splitlines())
+        for name in names:
+            if 'refs/heads/' + name in advertised:
+                refspecs.extend(refspec.replace('*', name) for refspec in CACHE_FETCH_REFSPECS)
+            elif 'refs/tags/' + name in advertised:
+                refspecs.append('+refs/tags/{0}:refs/tags/{0}'.format(name))
+            else:
+                return None
+    return refspecs
+
+
+class FetchTimeout(Exception):
+    """
+    Fetching a cached repo took longer than allowed
+    """
+
+
+def refresh_repo(path: str, revs: [str] = (), timeout: float = DEFAULT_FETCH_TIMEOUT) -> 'Repo':
+    """
+    Perform a fetch on a repo already locally cached
+    :param path: The patch shere the repo is locallt cached
+    :param revs: Revisions the fetch is for. When given only the refs or commits they name are fetched.
+    :param timeout: Seconds after which the fetch is killed and FetchTimeout raised, 0 for no limit
+    :return: The now 'fetched' repo object
+    """
+    from git import GitCommandError, Repo
+    repo = Repo(path=path)
+    deadline = time.time() + timeout if timeout else None
+
+    def remaining():
+        # Every git command of the fetch shares the one time limit
+        if deadline is None:
+            return None
+        left = deadline - time.time()
+        if left <= 0:
+            raise FetchTimeout('Fetching {} took more than {} seconds'.format(path, timeout))
+        return left
+
+    try:
+        refspecs = targeted_refspecs(repo, revs, remaining()) if revs else None
+        if refspecs:
+            try:
+                repo.git.fetch('origin', *refspecs, kill_after_timeout=remaining())
+                store_fetched_objects(repo)
+                # Only the branches and tags named were brought up to date
+                record_fetch(repo, [rev_ref_name(rev) for rev in revs if not FULL_SHA.match(rev)])
+                return repo
+            except GitCommandError:
+                # For example the server does not allow fetching commits by sha
+                pass
+        repo.remote().update(kill_after_timeout=remaining())
+    except GitCommandError:
+        # A git command killed for running out of time fails like any other
+        remaining()
+        raise
+    store_fetched_objects(repo)
+    record_fetch(repo)
+    return repo
+
+
+def is_local_repo(uri: str) -> bool:
+    return not re.match('^(https?://|git@|git://)', uri, re.IGNORECASE)
+
+
+def create_cache_path(uri: str) -> str:
+    return '{cache_dir}{uri}'.format(cache_dir=DEFAULT_CACHE_DIR,
+                                     uri=base64.urlsafe_b64encode(uri.encode('ascii')).decode('ascii'))
+
+
+def get_repo(uri: str, fetch: bool = True, revs: [str] = (), clone_filter: str = DEFAULT_CLONE_FILTER,
+             fetch_ttl: int = DEFAULT_FETCH_TTL, fetch_timeout: float = DEFAULT_FETCH_TIMEOUT,
+             shared_objects: bool = True) -> 'Repo':
+    """
+    This take a path to a repo, local or remote and returns a pythongit Repo object
+    If the path is remote it fetches and refreshes as needed.
+    :param uri: Path to local or remote repo 
+    :param fetch: Refresh an already cached remote repo
+    :param revs: Revisions the report needs, used to limit what is fetched and to skip fetches which are not needed
+    :param clone_filter: Partial clone filter used when the remote is not cached yet
+    :param fetch_ttl: Seconds after a fetch during which cached branches and tags are used without fetching
+    :param fetch_timeout: Seconds after which a fetch is given up and the repo used as cached, 0 for no limit. Clones
+        are not limited, without a cached copy there is nothing to fall back on.
+    :param shared_objects: Clone into the shared object store of the remote's project, see find_shared_store
+    :return: Repo object
+    """
+    from git import Repo
+
+    if is_local_repo(uri):
+        return Repo(uri)
+
+    cache_path = create_cache_path(uri=uri)
+    # Most of the time nothing needs fetching, which only needs a shared lock
+    with repo_lock(cache_path, exclusive=False):
+        if os.path.isdir(cache_path):
+            repo = Repo(cache_path)
+            if not fetch or revs_to_fetch(repo, revs, fetch_ttl) == []:
+                return repo
+
+    with repo_lock(cache_path, exclusive=True):
+        # Check again, another process may have cloned or fetched while we waited for the lock
+        if os.path.isdir(cache_path):
+            repo = Repo(cache_path)
+            if fetch:
+                missing = revs_to_fetch(repo, revs, fetch_ttl)
+                if missing is None or missing:
+                    try:
+                        repo = refresh_repo(cache_path, revs=missing or (), timeout=fetch_timeout)
+                    except FetchTimeout as e:
+                        # A slow remote should not hold up reports which the cached copy can answer
+                        sys.stderr.write('{}, using the cached copy instead\n'.format(e))
+        else:
+            repo = clone_repo(url=uri, cache_path=cache_path, clone_filter=clone_filter, shared_objects=shared_objects)
+    return repo
+
+
+@contextmanager
+def repo_lock(cache_path: str, exclusive: bool):
+    """
+    Lock a cached repo against other processes and threads. Any number of shared holders can read the repo while only
+    a single exclusive holder can clone or fetch it.
+    :param cache_path: Path of the cached repo, it does not need to exist yet
+    :param exclusive: Take an exclusive rather than a shared lock
+    :return: Context manager holding the lock
+    """
+    if fcntl is None:
+        yield
+        return
+    lock_path = cache_path.rstrip('/') + '.lock'
+    directory = os.path.dirname(lock_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def unlocked():
+    """
+    Stand in for a lock which is not needed, contextlib.nullcontext needs Python 3.7
+    :return: Context manager doing nothing
+    """
+    yield
+
+
+@contextmanager
+def reading_repo(uri: str):
+    """
+    Hold a shared lock on a cached remote repo while it is read. Local repos are not locked.
+    :param uri: Path to local or remote repo
+    :return: Context manager holding the lock
+    """
+    if is_local_repo(uri):
+        yield
+    else:
+        with repo_lock(create_cache_path(uri=uri), exclusive=False):
+            yield
+
+
+def commit_range(start: str, end: str) -> str:
+    """
+    Build the revision range, as understood by git, covering the commits between two commits
+    :param start: Start of the range
+    :param end: End of the range
+    :return: Revision range string
+    """
+    return '{start}...{end}'.format(start=start, end=end)
+
+
+def rev_filter_options(rev_filter: RevFilter) -> [str]:
+    """
+    :param rev_filter: RevFilter or None
+    :return: 'git log' and 'git rev-list' options applying the filter, other than paths
+    """
+    if rev_filter is None:
+        return []
+    options = ['--author=' + author for author in rev_filter.authors]
+    options.extend('--grep=' + pattern for pattern in rev_filter.grep)
+    if rev_filter.merges is not None:
+        options.append('--merges' if rev_filter.merges else '--no-merges')
+    return options
+
+
+def rev_filter_args(rev, rev_filter: RevFilter = None, end_of_options: bool = False) -> list:
+    """
+    Build the arguments which walk a range limited by a filter, so git never outputs the commits filtered out. Paths
+    are git pathspecs, which git answers from the commit-graph's changed path Bloom filters when it has them.
+    :param rev: Revision range, or list of revisions
+    :param rev_filter: RevFilter or None
+    :param end_of_options: Mark the end of the options, see supports_end_of_options
+    :return: List of arguments for 'git log' or 'git rev-list'
+    """
+    args = rev_filter_options(rev_filter)
+    if end_of_options:
+        args.append('--end-of-options')
+    args.append(rev)
+    if rev_filter is not None and rev_filter.paths:
+        args.append('--')
+        args.extend(rev_filter.paths)
+    return args
+
+
+def supports_end_of_options(repo: 'Repo') -> bool:
+    """
+    :param repo: Repo git will run in
+    :return: True if git understands --end-of-options, which keeps revisions from being read as options
+    """
+    return repo.git.version_info >= END_OF_OPTIONS_GIT_VERSION
+
+
+def iter_commits_gitpython(repo: 'Repo', rev: str, rev_filter: RevFilter = None):
+    """
+    Walk a commit range using GitPython's commit objects
+    :param repo: Repo to walk
+    :param rev: Revision range
+    :param rev_filter: Optional RevFilter limiting the commits walked
+    :return: Generator of RawCommit objects
+    """
+    paths = rev_filter.paths if rev_filter is not None else ()
+    # GitPython adds the paths itself
+    rev_filter = rev_filter._replace(paths=()) if rev_filter is not None else None
+    revs = rev_filter_args(rev, rev_filter, supports_end_of_options(repo))
+    for commit in repo.iter_commits(rev=revs, paths=list(paths)):
+        yield raw_commit_from_gitpython(commit)
+
+
+def iter_commits_git_log(repo: 'Repo', rev: str, rev_filter: RevFilter = None):
+    """
+    Walk a commit range with a single 'git log' process, parsing its output directly. This avoids looking up every
+    commit in the object database one at a time.
+    :param repo: Repo to walk
+    :param rev: Revision range
+    :param rev_filter: Optional RevFilter limiting the commits walked
+    :return: Generator of RawCommit objects
+    """
+    return run_git_log(repo, *rev_filter_args(rev, rev_filter, supports_end_of_options(repo)))
+
+
+def run_git_log(repo: 'Repo', *args, stdin_revs: [str] = None, **kwargs):
+    """
+    Run 'git log' with GIT_LOG_FORMAT and parse the records as they are produced
+    :param repo: Repo to run in
+    :param args: Extra positional arguments, revisions
+    :param stdin_revs: Revisions passed on stdin rather than the command line, which has a length limit
+    :param kwargs: Extra options passed on to git
+    :return: Generator of RawCommit objects
+    """
+    if stdin_revs is not None:
+        args += ('--stdin',)
+        kwargs['istream'] = subprocess.PIPE
+    proc = repo.git.log(*args, z=True, format=GIT_LOG_FORMAT, date='raw', encoding='UTF-8', as_process=True,
+                        **kwargs)
+    if stdin_revs is not None:
+        # git reads all of stdin before it writes anything, so this cannot fill both pipes
+        proc.stdin.write(''.join(rev + '\n' for rev in stdin_revs).encode('ascii'))
+        proc.stdin.close()
+    fields = []
+    remainder = b''
+    while True:
+        data = proc.stdout.read(GIT_LOG_READ_SIZE)
+        if not data:
+            break
+        tokens = (remainder + data).split(b'\0')
+        remainder = tokens.pop()
+        for token in tokens:
+            fields.append(token)
+            if len(fields) == GIT_LOG_FIELDS:
+                yield parse_git_log_record(fields)
+                fields = []
+    proc.wait()
+
+
+def parse_git_log_record(fields: [bytes]) -> RawCommit:
+    """
+    Convert the fields of one 'git log' record, see GIT_LOG_FORMAT, into a RawCommit. Author and message are left as
+    utf-8 bytes until they are needed.
+    :param fields: hex sha, author name, raw date ("<epoch> <+-hhmm>") and message
+    :return: RawCommit object
+    """
+    hexsha, author, date, message = fields
+    timestamp, offset = date.split(b' ')
+    offset_seconds = int(offset[1:3]) * 3600 + int(offset[3:5]) * 60
+    if offset.startswith(b'+'):
+        offset_seconds = -offset_seconds
+    return RawCommit(binsha=bytes.fromhex(hexsha.decode('ascii')),
+                     author=author,
+                     authored_date=int(timestamp),
+                     author_tz_offset=offset_seconds,
+                     message=message)
+
+
+def load_commits_gitpython(repo: 'Repo', binshas: [bytes]):
+    """
+    Read specific commits using GitPython's commit objects
+    :param repo: Repo to read from
+    :param binshas: Binary shas of the commits wanted
+    :return: Generator of RawCommit objects
+    """
+    from git import Commit
+    for binsha in binshas:
+        yield raw_commit_from_gitpython(Commit(repo, binsha))
+
+
+def load_commits_git_log(repo: 'Repo', binshas: [bytes]):
+    """
+    Read specific commits with a single 'git log' process
+    :param repo: Repo to read from
+    :param binshas: Binary shas of the commits wanted, as many as MAX_CHUNK_SIZE
+    :return: Generator of RawCommit objects
+    """
+    return run_git_log(repo, stdin_revs=[binsha.hex() for binsha in binshas], no_walk='unsorted')
+
+
+COMMIT_BACKENDS = {
+    'gitpython': iter_commits_gitpython,
+    'git-log': iter_commits_git_log,
+}
+
+COMMIT_LOADERS = {
+    'gitpython': load_commits_gitpython,
+    'git-log': load_commits_git_log,
+}
+
+
+def iter_range_shas(repo: 'Repo', rev: str, rev_filter: RevFilter = None):
+    """
+    List the commits in a range without reading the commits themselves
+    :param repo: Repo to walk
+    :param rev: Revision range
+    :param rev_filter: Optional RevFilter limiting the commits listed
+    :return: Generator of binary shas in 'git rev-list' order
+    """
+    proc = repo.git.rev_list(*rev_filter_args(rev, rev_filter, supports_end_of_options(repo)), as_process=True)
+    for line in proc.stdout:
+        yield bytes.fromhex(line.strip().decode('ascii'))
+    proc.wait()
+
+
+def open_metadata_cache(path: str = DEFAULT_METADATA_CACHE) -> 'sqlite3.Connection':
+    """
+    Open, creating if needed, the on disk store of commit metadata. Commits never change so entries are keyed by sha and
+    only leave the store when it grows past its size limit.
+    :param path: Location of the SQLite database
+    :return: Database connection
+    """
+    import sqlite3
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute('CREATE TABLE IF NOT EXISTS commits ('
+                 'sha BLOB PRIMARY KEY, author TEXT, authored_date INTEGER, author_tz_offset INTEGER, '
+                 'message TEXT, size INTEGER, last_used INTEGER)')
+    conn.execute('CREATE INDEX IF NOT EXISTS commits_last_used ON commits (last_used)')
+    # The total size is kept up to date as commits come and go, so checking it does not read the whole table
+    conn.execute('CREATE TABLE IF NOT EXISTS cache_size (total INTEGER)')
+    conn.execute('CREATE TRIGGER IF NOT EXISTS commits_added AFTER INSERT ON commits '
+                 'BEGIN UPDATE cache_size SET total = total + NEW.size; END')
+    conn.execute('CREATE TRIGGER IF NOT EXISTS commits_removed AFTER DELETE ON commits '
+                 'BEGIN UPDATE cache_size SET total = total - OLD.size; END')
+    with conn:
+        if conn.execute('SELECT total FROM cache_size').fetchone() is None:
+            # New, or written before the total was kept
+            conn.execute('INSERT INTO cache_size SELECT COALESCE(SUM(size), 0) FROM commits')
+    return conn
+
+
+def iter_commits_cached(repo: 'Repo', rev: str, backend: str, cache: 'sqlite3.Connection',
+                        rev_filter: RevFilter = None):
+    """
+    Walk a commit range, reading commits from the metadata cache when possible and from the repo otherwise.
+    Commits read from the repo are added to the cache.
+    :param repo: Repo to walk
+    :param rev: Revision range
+    :param backend: Name of the backend used for commits missing from the cache
+    :param cache: Connection returned by open_metadata_cache
+    :param rev_filter: Optional RevFilter limiting the commits walked
+    :return: Generator of RawCommit objects in range order
+    """
+    batch = []
+    for binsha in iter_range_shas(repo, rev, rev_filter):
+        batch.append(binsha)
+        if len(batch) == METADATA_CACHE_BATCH:
+            yield from _resolve_cached_batch(repo, batch, backend, cache)
+            batch = []
+    if batch:
+        yield from _resolve_cached_batch(repo, batch, backend, cache)
+
+
+def _resolve_cached_batch(repo: 'Repo', binshas: [bytes], backend: str, cache: 'sqlite3.Connection') -> [RawCommit]:
+    now = int(time.time())
+    found = {}
+    query = 'SELECT sha, author, authored_date, author_tz_offset, message FROM commits WHERE sha IN ({})'.format(
+        ','.join('?' * len(binshas)))
+    for row in cache.execute(query, binshas):
+        found[bytes(row[0])] = RawCommit(bytes(row[0]), *row[1:])
+
+    missing = [binsha for binsha in binshas if binsha not in found]
+    loaded = list(COMMIT_LOADERS[backend](repo, missing)) if missing else []
+    with cache:
+        cache.executemany('UPDATE commits SET last_used = ? WHERE sha = ?', [(now, binsha) for binsha in found])
+        # Another report may have added the same commits meanwhile, commits never change so theirs are kept
+        cache.executemany('INSERT OR IGNORE INTO commits VALUES (?, ?, ?, ?, ?, ?, ?)',
+                          [(raw.binsha, raw.author, raw.authored_date, raw.author_tz_offset, raw.message,
+                            len(raw.author) + len(raw.message), now) for raw in loaded])
+    found.update((raw.binsha, raw) for raw in loaded)
+    return [found[binsha] for binsha in binshas]
+
+
+def trim_metadata_cache(cache: 'sqlite3.Connection', max_size: int = DEFAULT_METADATA_CACHE_SIZE) -> int:
+    """
+    Evict the least recently used commits until the cache holds no more than max_size megabytes of commit data
+    :param cache: Connection returned by open_metadata_cache
+    :param max_size: Size limit in megabytes
+    :return: Number of commits evicted
+    """
+    excess = cache.execute('SELECT total FROM cache_size').fetchone()[0] - max_size * 1024 * 1024
+    evict = []
+    if excess > 0:
+        for sha, size in cache.execute('SELECT sha, size FROM commits ORDER BY last_used'):
+            evict.append((sha,))
+            excess -= size
+            if excess <= 0:
+                break
+    with cache:
+        cache.executemany('DELETE FROM commits WHERE sha = ?', evict)
+    return len(evict)
+
+
+def raw_commit_from_gitpython(commit: 'Commit') -> RawCommit:
+    """
+    Extract the fields needed for reports from a GitPython commit object
+    :param commit: The commit being worked on
+    :return: RawCommit object
+    """
+    return RawCommit(binsha=commit.binsha,
+                     author=commit.author.name,
+                     authored_date=commit.authored_date,
+                     author_tz_offset=commit.author_tz_offset,
+                     message=commit.message)
+
+
+def format_timestamp(authored_date: int, author_tz_offset: int) -> str:
+    """
+    Render a commit timestamp in the author's timezone
+    :param authored_date: Seconds since the epoch
+    :param author_tz_offset: Seconds west of UTC
+    :return: Timestamp string
+    """
+    tz = timezone(timedelta(seconds=-author_tz_offset))
+    return datetime.fromtimestamp(authored_date, tz).strftime("%x %X")
+
+
+def checkpoint_key(uri: str, start: str, end: str, rev_filter: RevFilter = None) -> str:
+    """
+    :param uri: Path to local or remote repo
+    :param start: Start of the range as given by the user, for example a release tag
+    :param end: End of the range as given by the user, for example a branch
+    :param rev_filter: RevFilter the range is walked with, filtered walks have checkpoints of their own
+    :return: Key of the checkpoint for reports on this range
+    """
+    key = [uri, start, end]
+    if rev_filter is not None:
+        key.append(rev_filter)
+    return json.dumps(key)
+
+
+def open_checkpoints(path: str = DEFAULT_CHECKPOINTS) -> 'sqlite3.Connection':
+    """
+    Open, creating if needed, the on disk store of checkpoints. Each checkpoint holds the commits of a range, one row per
+    commit, so a range that grew only has its new commits added.
+    :param path: Location of the SQLite database
+    :return: Database connection
+    """
+    import sqlite3
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    # Reports keep reading a checkpoint while another report updates it
+    conn.execute('PRAGMA journal_mode=WAL')
+    # A NULL key marks a checkpoint still being written
+    conn.execute('CREATE TABLE IF NOT EXISTS checkpoints ('
+                 'id INTEGER PRIMARY KEY, key TEXT UNIQUE, start_sha TEXT, end_sha TEXT)')
+    # Rows are in report order when sorted by commit_date, highest first, then seq. commit_date is the lowest
+    # committer date seen so far along the walk, so it never rises even when clocks were wrong.
+    conn.execute('CREATE TABLE IF NOT EXISTS checkpoint_commits ('
+                 'checkpoint INTEGER, seq INTEGER, commit_date INTEGER, sha BLOB, author TEXT, '
+                 'authored_date INTEGER, author_tz_offset INTEGER, message TEXT, PRIMARY KEY (checkpoint, seq))')
+    conn.execute('CREATE INDEX IF NOT EXISTS checkpoint_commits_order '
+                 'ON checkpoint_commits (checkpoint, commit_date DESC, seq)')
+    return conn
+
+
+def iter_commit_dates(repo: 'Repo', rev, rev_filter: RevFilter = None):
+    """
+    List the commits in a range with their committer dates, without reading the commits themselves
+    :param repo: Repo to walk
+    :param rev: Revision range, or list of revisions
+    :param rev_filter: Optional RevFilter limiting the commits listed
+    :return: Generator of (binary sha, committer date) tuples in 'git rev-list' order
+    """
+    proc = repo.git.rev_list('--timestamp', *rev_filter_args(rev, rev_filter, supports_end_of_options(repo)),
+                             as_process=True)
+    for line in proc.stdout:
+        timestamp, hexsha = line.split()
+        yield bytes.fromhex(hexsha.decode('ascii')), int(timestamp)
+    proc.wait()
+
+
+def _checkpoint_rows(checkpoint_id: int, commits, dates, first_seq: int = 0):
+    """
+    Pair the commits of a walk with the rows storing them in a checkpoint
+    :param checkpoint_id: Checkpoint the rows belong to
+    :param commits: RawCommit objects as walked
+    :param dates: Output of iter_commit_dates for the same walk
+    :param first_seq: seq of the first row
+    :return: Generator of (RawCommit, row) tuples
+    """
+    floor = None
+    for seq, (raw, (binsha, commit_date)) in enumerate(zip(commits, dates), first_seq):
+        if raw.binsha != binsha:
+            raise ValueError('Commit {} walked out of order'.format(raw.binsha.hex()))
+        floor = commit_date if floor is None else min(floor, commit_date)
+        yield raw, (checkpoint_id, seq, floor, raw.binsha, raw.author, raw.authored_date, raw.author_tz_offset,
+                    raw.message)
+
+
+def iter_commits_incremental(repo: 'Repo', uri: str, start: str, end: str, walk,
+                             checkpoints: str = DEFAULT_CHECKPOINTS, rev_filter: RevFilter = None):
+    """
+    Walk a range reusing the checkpoint of an earlier report on it. When the range only grew at the end since then,
+    just the new commits are read and added to the checkpoint, which then gives the range in the order of a full walk.
+    If the start moved or history was rewritten the whole range is walked again and replaces the checkpoint. Ranges
+    limited to paths are always walked in full, without a checkpoint.
+    :param repo: Repo to walk
+    :param uri: Path to local or remote repo, part of the checkpoint key
+    :param start: Start of the range
+    :param end: End of the range
+    :param walk: Function taking a revision, or list of revisions, and returning an iterable of RawCommit objects
+    :param checkpoints: Location of the checkpoint database
+    :param rev_filter: RevFilter walk applies, if any, part of the checkpoint key
+    :return: Generator of RawCommit objects in range order, nothing is read until it is iterated
+    """
+    if rev_filter is not None and rev_filter.paths:
+        # History simplification hides side branches a merge did not take the paths from. A later merge taking them
+        # from such a branch brings back commits the checkpoint never had, which walking old_end..end leaves out.
+        yield from walk(commit_range(start, end))
+        return
+    start_sha = repo.git.rev_parse(start + '^{commit}')
+    end_sha = repo.git.rev_parse(end + '^{commit}')
+    key = checkpoint_key(uri, start, end, rev_filter)
+    conn = open_checkpoints(checkpoints)
+    try:
+        checkpoint = conn.execute('SELECT id, start_sha, end_sha FROM checkpoints WHERE key = ?', (key,)).fetchone()
+        # Whether START is an ancestor does not matter, the commits it leaves out stay left out. Asking git would
+        # walk the whole range.
+        if (checkpoint and checkpoint[1] == start_sha and resolves_locally(repo, checkpoint[2]) and
+                repo.is_ancestor(checkpoint[2], end_sha)):
+            checkpoint_id, old_end = checkpoint[0], checkpoint[2]
+            if old_end != end_sha and not _extend_checkpoint(conn, repo, checkpoint_id, old_end, end_sha, start_sha,
+                                                             walk, rev_filter):
+                # Another report moved the checkpoint meanwhile
+                yield from walk(commit_range(start_sha, end_sha))
+                return
+            rows = conn.execute('SELECT sha, author, authored_date, author_tz_offset, message FROM checkpoint_commits '
+                                'WHERE checkpoint = ? ORDER BY commit_date DESC, seq', (checkpoint_id,))
+            for row in rows:
+                yield RawCommit(bytes(row[0]), *row[1:])
+        else:
+            yield from _replace_checkpoint(conn, repo, key, start_sha, end_sha, walk, rev_filter)
+    finally:
+        conn.close()
+
+
+def _extend_checkpoint(conn: 'sqlite3.Connection', repo: 'Repo', checkpoint_id: int, old_end: str, end_sha: str,
+                       start_sha: str, walk, rev_filter: RevFilter) -> bool:
+    """
+    Add the commits between the old and new end of a range to its checkpoint
+    :return: False if the checkpoint no longer ended at old_end
+    """
+    # The range was start..old_end and is now start..end, only old_end..end is new. A merge can bring in commits
+    # older than stored ones, their commit_date puts them in place among the stored commits. Ties go to the new
+    # commits, seq values below the stored ones put them first as a full walk would.
+    revs = [end_sha, '^' + old_end, '^' + start_sha]
+    new = list(walk(revs))
+    lowest = conn.execute('SELECT COALESCE(MIN(seq), 0) FROM checkpoint_commits WHERE checkpoint = ?',
+                          (checkpoint_id,)).fetchone()[0]
+    rows = [row for _, row in _checkpoint_rows(checkpoint_id, new, iter_commit_dates(repo, revs, rev_filter),
+                                               lowest - len(new))]
+    with conn:
+        moved = conn.execute('UPDATE checkpoints SET end_sha = ? WHERE id = ? AND end_sha = ?',
+                             (end_sha, checkpoint_id, old_end)).rowcount
+        if moved:
+            conn.executemany('INSERT INTO checkpoint_commits VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    return bool(moved)
+
+
+def _replace_checkpoint(conn: 'sqlite3.Connection', repo: 'Repo', key: str, start_sha: str, end_sha: str, walk,
+                        rev_filter: RevFilter):
+    """
+    Walk a whole range, storing its commits as they are reported and replacing the range's checkpoint once done
+    :return: Generator of RawCommit objects in range order
+    """
+    rev = commit_range(start_sha, end_sha)
+    with conn:
+        checkpoint_id = conn.execute('INSERT INTO checkpoints (key, start_sha, end_sha) VALUES (NULL, ?, ?)',
+                                     (start_sha, end_sha)).lastrowid
+    complete = False
+    try:
+        batch = []
+        for raw, row in _checkpoint_rows(checkpoint_id, walk(rev), iter_commit_dates(repo, rev, rev_filter)):
+            batch.append(row)
+            if len(batch) == METADATA_CACHE_BATCH:
+                with conn:
+                    conn.executemany('INSERT INTO checkpoint_commits VALUES (?, ?, ?, ?, ?, ?, ?, ?)', batch)
+                batch = []
+            yield raw
+        with conn:
+            conn.executemany('INSERT INTO checkpoint_commits VALUES (?, ?, ?, ?, ?, ?, ?, ?)', batch)
+            for (old_id,) in conn.execute('SELECT id FROM checkpoints WHERE key = ?', (key,)).fetchall():
+                conn.execute('DELETE FROM checkpoint_commits WHERE checkpoint = ?', (old_id,))
+                conn.execute('DELETE FROM checkpoints WHERE id = ?', (old_id,))
+            conn.execute('UPDATE checkpoints SET key = ? WHERE id = ?', (key, checkpoint_id))
+        complete = True
+    finally:
+        if not complete:
+            # The report stopped early or failed, the partial checkpoint is of no use
+            with conn:
+                conn.execute('DELETE FROM checkpoint_commits WHERE checkpoint = ?', (checkpoint_id,))
+                conn.execute('DELETE FROM checkpoints WHERE id = ?', (checkpoint_id,))
+
+
+def _first_literal(subpattern) -> str:
+    """
+    Find the first run of literal characters every match of a parsed regex must contain
+    :param subpattern: Output of sre_parse.parse, or a group within it
+    :return: The literal, empty if none was found
+    """
+    run = ''
+    for op, av in subpattern:
+        if op is sre_parse.LITERAL:
+            run += chr(av)
+            continue
+        if run:
+            return run
+        if op is sre_parse.SUBPATTERN:
+            if len(av) == 4 and av[1] & re.IGNORECASE:
+                return ''
+            found = _first_literal(av[-1])
+            if found:
+                return found
+    return run
+
+
+def issue_prefilter(pattern: str):
+    """
+    Pick a literal string every match of an issue regex contains. Messages without it can skip the regex.
+    :param pattern: Issue regex
+    :return: The literal, or None when one could not be determined
+    """
+    try:
+        if re.compile(pattern).flags & re.IGNORECASE:
+            return None
+        return _first_literal(sre_parse.parse(pattern)) or None
+    except Exception:
+        return None
+
+
+def _namespace_groups(pattern: str, prefix: str) -> str:
+    return re.sub(r'\(\?P([<=])(\w+)', lambda m: '(?P{}{}{}'.format(m.group(1), prefix, m.group(2)), pattern)
+
+
+@lru_cache(maxsize=32)
+def compile_issue_matcher(trackers: (IssueTracker,)) -> IssueMatcher:
+    """
+    Compile a set of issue trackers once so every message can be searched for all of them in a single pass.
+    Each tracker's pattern must have 'id' and 'display' groups.
+    :param trackers: Tuple of IssueTracker objects
+    :return: IssueMatcher object
+    """
+    if len(trackers) == 1:
+        regex = re.compile(trackers[0].pattern)
+    else:
+        try:
+            regex = re.compile('|'.join('(?P<t{index}>{pattern})'.format(
+                index=index, pattern=_namespace_groups(tracker.pattern, 't{}_'.format(index)))
+                for index, tracker in enumerate(trackers)))
+        except re.error:
+            # Patterns which cannot be combined, for example ones using global flags, are searched one by one
+            regex = None
+    prefilters = tuple(issue_prefilter(tracker.pattern) for tracker in trackers)
+    return IssueMatcher(regex=regex,
+                        trackers=trackers,
+                        prefilters=None if None in prefilters else prefilters)
+
+
+def find_issues(matcher: IssueMatcher, message: str) -> [IssueData]:
+    """
+    Find all issues, of any tracker, mentioned in a message
+    :param matcher: Compiled trackers from compile_issue_matcher
+    :param message: Commit message
+    :return: List of IssueData objects in the order they appear
+    """
+    if matcher.prefilters is not None and not any(literal in message for literal in matcher.prefilters):
+        return []
+
+    if len(matcher.trackers) == 1:
+        tracker = matcher.trackers[0]
+        return [IssueData(id=found.group('id').lower(), display=found.group('display'),
+                          link_template=tracker.link_template) for found in matcher.regex.finditer(message)]
+
+    if matcher.regex is None:
+        found = sorted(((match.start(), index, match) for index, tracker in enumerate(matcher.trackers)
+                        for match in re.finditer(tracker.pattern, message)), key=lambda item: item[:2])
+        return [IssueData(id=match.group('id').lower(), display=match.group('display'),
+                          link_template=matcher.trackers[index].link_template) for _, index, match in found]
+
+    issues = []
+    for found in matcher.regex.finditer(message):
+        prefix = found.lastgroup + '_'
+        issues.append(IssueData(id=found.group(prefix + 'id').lower(), display=found.group(prefix + 'display'),
+                                link_template=matcher.trackers[int(found.lastgroup[1:])].link_template))
+    return issues
+
+
+def build_issue_matcher(issue_id_matcher: str = DEFAULT_ISSUE_ID_MATCHER, issue_trackers=()) -> IssueMatcher:
+    """
+    Compile the default issue regex together with any additional trackers
+    :param issue_id_matcher: Regex for the default tracker, linked with the report's link template
+    :param issue_trackers: Iterable of (name, regex, link template) for additional trackers
+    :return: IssueMatcher object
+    """
+    trackers = [IssueTracker(name='default', pattern=issue_id_matcher, link_template=None)]
+    trackers.extend(IssueTracker(*tracker) for tracker in issue_trackers)
+    return compile_issue_matcher(tuple(trackers))
+
+
+def decode_text(text) -> str:
+    """
+    :param text: str, or utf-8 bytes as read from git
+    :return: str
+    """
+    return text.decode('utf-8', 'replace') if isinstance(text, bytes) else text
+
+
+class CommitRecord:
+    """
+    Compact processed commit. It has the same fields as CommitData but keeps the binary sha, epoch timestamp and
+    undecoded text, only turning them into strings when a formatter reads them.
+    """
+    __slots__ = ('binsha', 'author_raw', 'authored_date', 'author_tz_offset', 'message_raw', 'issues')
+
+    def __init__(self, binsha: bytes, author_raw, authored_date: int, author_tz_offset: int, message_raw,
+                 issues: (IssueData,) = ()):
+        self.binsha = binsha
+        self.author_raw = author_raw
+        self.authored_date = authored_date
+        self.author_tz_offset = author_tz_offset
+        self.message_raw = message_raw
+        self.issues = issues
+
+    @property
+    def id(self) -> str:
+        return self.binsha.hex()
+
+    @property
+    def author(self) -> str:
+        return decode_text(self.author_raw)
+
+    @property
+    def timestamp(self) -> str:
+        return format_timestamp(self.authored_date, self.author_tz_offset)
+
+    @property
+    def messages(self) -> str:
+        return decode_text(self.message_raw)
+
+    def __eq__(self, other):
+        return isinstance(other, CommitRecord) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return 'CommitRecord(id={!r}, author={!r}, timestamp={!r})'.format(self.id, self.author, self.timestamp)
+
+
+def process_raw_commit(raw: RawCommit, include_links: bool,
+                       issue_id_matcher=DEFAULT_ISSUE_ID_MATCHER, timer=None) -> CommitRecord:
+    """
+    Convert a RawCommit into a CommitRecord for easier use
+    :param raw: The commit being worked on
+    :param include_links: Should we look for jira issues to link to later
+    :param issue_id_matcher: IssueMatcher, or a regex to identify Jira issues. Should return 'id' and 'display' groups
+    :param timer: Optional StageTimer, issue extraction is timed as its own stage
+    :return: CommitRecord object
+    """
+    message = raw.message
+    issues = ()
+    if include_links:
+        if not isinstance(issue_id_matcher, IssueMatcher):
+            issue_id_matcher = build_issue_matcher(issue_id_matcher)
+        # The message had to be decoded for matching, keep the decoded form rather than decoding it again later
+        message = decode_text(message)
+        if timer is None:
+            issues = tuple(find_issues(issue_id_matcher, message))
+        else:
+            with timer.stage('issue_extraction'):
+                issues = tuple(find_issues(issue_id_matcher, message))
+
+    return CommitRecord(binsha=raw.binsha,
+                        author_raw=raw.author,
+                        authored_date=raw.authored_date,
+                        author_tz_offset=raw.author_tz_offset,
+                        message_raw=message,
+                        issues=issues)
+
+
+def process_commit(commit: 'Commit', include_links: bool, issue_id_matcher=DEFAULT_ISSUE_ID_MATCHER) -> CommitRecord:
+    """
+    Convert commit object into CommitRecord object for easier use
+    :param commit: The commit being worked on
+    :param include_links: Should we look for jira issues to link to later 
+    :param issue_id_matcher: IssueMatcher, or a regex to identify Jira issues. Should return 'id' and 'display' groups
+    :return: CommitRecord object
+    """
+    return process_raw_commit(raw_commit_from_gitpython(commit), include_links, issue_id_matcher)
+
+
+# Per process state of parallel processing workers, set up by _init_worker
+_worker = {}
+
+
+def _init_worker(repo_path: str, backend: str, include_links: bool, issue_id_matcher: str, issue_trackers,
+                 metadata_cache: str):
+    from git import Repo
+    _worker['repo'] = Repo(repo_path)
+    _worker['backend'] = backend
+    _worker['include_links'] = include_links
+    _worker['matcher'] = build_issue_matcher(issue_id_matcher, issue_trackers)
+    _worker['cache'] = open_metadata_cache(metadata_cache) if metadata_cache else None
+
+
+def _process_chunk(binshas: [bytes]):
+    started = time.perf_counter()
+    repo, backend, cache = _worker['repo'], _worker['backend'], _worker['cache']
+    if cache:
+        raws = []
+        for offset in range(0, len(binshas), METADATA_CACHE_BATCH):
+            raws.extend(_resolve_cached_batch(repo, binshas[offset:offset + METADATA_CACHE_BATCH], backend, cache))
+    else:
+        raws = COMMIT_LOADERS[backend](repo, binshas)
+    records = [process_raw_commit(raw, _worker['include_links'], _worker['matcher']) for raw in raws]
+    return records, time.perf_counter() - started
+
+
+def process_commits_parallel(repo: 'Repo', binshas, jobs: int, backend: str = DEFAULT_BACKEND,
+                             include_links: bool = False, issue_id_matcher: str = DEFAULT_ISSUE_ID_MATCHER,
+                             issue_trackers=(), metadata_cache: str = None):
+    """
+    Read and process commits in a pool of worker processes, each with its own handle on the repo. The shas are handed
+    out in chunks, sized from the time earlier chunks took, and the results are put back in their original order.
+    :param repo: Repo the commits are in
+    :param binshas: Iterable of binary shas, for example from iter_range_shas
+    :param jobs: Number of worker processes
+    :param backend: Name of the backend used to read commits
+    :param include_links: Should we look for issues to link to later
+    :param issue_id_matcher: Regex for the default issue tracker
+    :param issue_trackers: Iterable of (name, regex, link template) for additional trackers
+    :param metadata_cache: Path of the metadata cache, None to always read commits from the repo
+    :return: Generator of CommitRecord objects in the order of binshas
+    """
+    import multiprocessing
+    binshas = list(binshas)
+    initargs = (repo.git_dir, backend, include_links, issue_id_matcher, tuple(map(tuple, issue_trackers)),
+                metadata_cache)
+    with multiprocessing.Pool(jobs, initializer=_init_worker, initargs=initargs) as pool:
+        pending = deque()
+        offset = 0
+        chunk_size = MIN_CHUNK_SIZE
+        while offset < len(binshas) or pending:
+            # Keep every worker busy with a chunk queued behind the one it is working on
+            while offset < len(binshas) and len(pending) < jobs * 2:
+                pending.append(pool.apply_async(_process_chunk, (binshas[offset:offset + chunk_size],)))
+                offset += chunk_size
+            records, seconds = pending.popleft().get()
+            if records:
+                chunk_size = int(CHUNK_TARGET_SECONDS * len(records) / max(seconds, 1e-6))
+                chunk_size = max(MIN_CHUNK_SIZE, min(MAX_CHUNK_SIZE, chunk_size))
+            yield from records
+
+
+def generate_link_list(template: str, issues: [IssueData]) -> [str]:
+    """
+    Applies link template to a list of Issues
+    :param template: Template used for issues without a template of their own
+    :param issues: List of IssueData objects
+    :return: List of rendered strings
+    """
+    return [(issue.link_template or template).format(id=issue.id, display=issue.display) for issue in issues]
+
+
+def stream_for_humans(commitdata: [CommitData],
+                      include_links: bool = False,
+                      link_template: str = DEFAULT_LINK_TEMPLATE):
+    """
+    Format output in human pleasing way, one commit at a time
+    :param commitdata: Iterable of Commitdata objects
+    :param include_links: Boolean indictaed weather we want to display Jira links
+    :param link_template: String which template to format Jira links
+    :return: Generator of string chunks suitable for output
+    """
+    message_padding = '\n' + (80 * ' ')
+    separator = ''
+    for commit in commitdata:
+        lines = ["{id} {author:20.20} {timestamp} {messages}".format(
+            id=commit.id,
+            author=commit.author,
+            timestamp=commit.timestamp,
+            messages=commit.messages.rstrip().replace('\n', message_padding)  # Line up multiple messages
+        )]
+        if include_links and commit.issues:
+            lines.append('Linked Jira Issues:')
+            lines.extend(generate_link_list(template=link_template, issues=commit.issues))
+        yield separator + '\n'.join(lines) + '\n'
+        separator = '\n'
+
+
+def stream_for_json(commitdata: [CommitData],
+                    include_links: bool = False,
+                    link_template: str = DEFAULT_LINK_TEMPLATE):
+    """
+    Format output as a json array, one commit at a time
+    :param commitdata: Iterable of Commitdata objects
+    :param include_links: Boolean indictaed weather we want to display Jira links
+    :param link_template: String which template to format Jira links
+    :return: Generator of string chunks which together form a json array
+    """
+    separator = '['
+    for commit in commitdata:
+        yield separator + json.dumps(commit_to_dict(commit, include_links, link_template))
+        separator = ', '
+    yield '[]' if separator == '[' else ']'
+
+
+def stream_for_ndjson(commitdata: [CommitData],
+                      include_links: bool = False,
+                      link_template: str = DEFAULT_LINK_TEMPLATE):
+    """
+    Format output as newline delimited json, one object per commit
+    :param commitdata: Iterable of Commitdata objects
+    :param include_links: Boolean indictaed weather we want to display Jira links
+    :param link_template: String which template to format Jira links
+    :return: Generator of json lines
+    """
+    for commit in commitdata:
+        yield json.dumps(commit_to_dict(commit, include_links, link_template)) + '\n'
+
+
+def import_pyarrow():
+    """
+    :return: The pyarrow module, which is optional and only imported once Arrow output is asked for
+    """
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError('Arrow output needs the pyarrow package')
+    return pyarrow
+
+
+def arrow_schema(include_links: bool = False):
+    """
+    :param include_links: Include a column of rendered issue links
+    :return: pyarrow schema of --arrow output
+    """
+    pyarrow = import_pyarrow()
+    fields = [pyarrow.field('id', pyarrow.binary(20)),
+              pyarrow.field('author', pyarrow.dictionary(pyarrow.int32(), pyarrow.string())),
+              pyarrow.field('authored_date', pyarrow.timestamp('s', tz='UTC')),
+              pyarrow.field('author_tz_offset', pyarrow.int32()),
+              pyarrow.field('messages', pyarrow.string()),
+              pyarrow.field('issues', pyarrow.list_(pyarrow.string()))]
+    if include_links:
+        fields.append(pyarrow.field('issue_links', pyarrow.list_(pyarrow.string())))
+    return pyarrow.schema(fields)
+
+
+def commits_to_arrow(commits: [CommitRecord], include_links: bool, link_template: str):
+    """
+    Convert commits into one Arrow record batch. Authors are dictionary encoded within the batch.
+    :param commits: List of CommitRecord objects
+    :param include_links: Boolean indicating weather we want the issue links
+    :param link_template: String which template to format issue links
+    :return: pyarrow RecordBatch matching arrow_schema
+    """
+    pyarrow = import_pyarrow()
+    schema = arrow_schema(include_links)
+    authors = OrderedDict()
+    author_indices = [authors.setdefault(commit.author, len(authors)) for commit in commits]
+    arrays = [pyarrow.array([commit.binsha for commit in commits], schema.field('id').type),
+              pyarrow.DictionaryArray.from_arrays(pyarrow.array(author_indices, pyarrow.int32()),
+                                                  pyarrow.array(list(authors), pyarrow.string())),
+              pyarrow.array([commit.authored_date for commit in commits], schema.field('authored_date').type),
+              pyarrow.array([commit.author_tz_offset for commit in commits], pyarrow.int32()),
+              pyarrow.array([commit.messages for commit in commits], pyarrow.string()),
+              pyarrow.array([[issue.id for issue in commit.issues] for commit in commits],
+                            schema.field('issues').type)]
+    if include_links:
+        arrays.append(pyarrow.array([generate_link_list(template=link_template, issues=commit.issues)
+                                     for commit in commits], schema.field('issue_links').type))
+    return pyarrow.RecordBatch.from_arrays(arrays, names=schema.names)
+
+
+def stream_for_arrow(commitdata: [CommitRecord],
+                     include_links: bool = False,
+                     link_template: str = DEFAULT_LINK_TEMPLATE,
+                     batch_size: int = ARROW_BATCH_SIZE):
+    """
+    Format output as an Arrow IPC stream, one record batch per batch_size commits. Ids are kept as 20 byte binary
+    shas and timestamps as seconds since the epoch with the author's offset alongside.
+    :param commitdata: Iterable of CommitRecord objects
+    :param include_links: Boolean indicating weather we want to display issue links
+    :param link_template: String which template to format issue links
+    :param batch_size: Number of commits per record batch
+    :return: Generator of bytes chunks which together form an Arrow IPC stream
+    """
+    pyarrow = import_pyarrow()
+    sink = io.BytesIO()
+    writer = pyarrow.RecordBatchStreamWriter(sink, arrow_schema(include_links))
+
+    def written():
+        chunk = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return chunk
+
+    batch = []
+    for commit in commitdata:
+        batch.append(commit)
+        if len(batch) == batch_size:
+            writer.write_batch(commits_to_arrow(batch, include_links, link_template))
+            batch = []
+            yield written()
+    if batch:
+        writer.write_batch(commits_to_arrow(batch, include_links, link_template))
+    writer.close()
+    yield written()
+
+
+# Formatters producing bytes rather than text
+BINARY_FORMATTERS = (stream_for_arrow,)
 
 
-def clone_repo(url: str, cache_path: str) -> Repo:
+def commit_to_dict(commit: CommitData, include_links: bool, link_template: str) -> dict:
     """
-    Clone a remote repo to a local path
-    :param url: The remote repo URI
-    :param cache_path: A local filesystem path to clone to
-    :return: A Repo object
+    Convert a commit into the dict used by the json formatters
+    :param commit: Commitdata object
+    :param include_links: Boolean indictaed weather we want to display Jira links
+    :param link_template: String which template to format Jira links
+    :return: dict ready to be serialized
     """
-    return Repo.clone_from(url=url, to_path=cache_path)
+    obj = {"id": commit.id,
+           "author": commit.author,
+           "timestamp": commit.timestamp,
+           "messages": commit.messages}
+    if include_links and commit.issues:
+        obj['issue_links'] = generate_link_list(template=link_template, issues=commit.issues)
+    return obj
 
 
-def refresh_repo(path: str) -> Repo:
-    """
-    Perform a fetch on a repo already locally cached
-    :param path: The patch shere the repo is locallt cached
-    :return: The now 'fetched' repo object
-    """
-    repo = Repo(path=path)
-    repo.remote().update()
-    return repo
+def _summary_times(summary: dict, commit) -> None:
+    if summary['first'] is None or commit.authored_date < summary['first'].authored_date:
+        summary['first'] = commit
+    if summary['last'] is None or commit.authored_date > summary['last'].authored_date:
+        summary['last'] = commit
 
 
-def is_local_repo(uri: str) -> bool:
-    return not re.match('^(https?://|git@|git://)', uri, re.IGNORECASE)
+def _finish_summary(summary: dict) -> dict:
+    summary['first'] = summary['first'].timestamp
+    summary['last'] = summary['last'].timestamp
+    return summary
 
 
-def create_cache_path(uri: str) -> str:
-    return '{cache_dir}{uri}'.format(cache_dir=DEFAULT_CACHE_DIR,
-                                     uri=base64.urlsafe_b64encode(uri.encode('ascii')).decode('ascii'))
+def summarize_by_issue(commitdata: [CommitRecord],
+                       include_links: bool = False,
+                       link_template: str = DEFAULT_LINK_TEMPLATE) -> [dict]:
+    """
+    Group the commits of a range by the issues they mention, in a single pass over the commits
+    :param commitdata: Iterable of CommitRecord objects, processed with issue matching
+    :param include_links: Boolean indicating weather we want to display issue links
+    :param link_template: Template used for issues without a template of their own
+    :return: List of dicts, one per issue in order of first appearance, with the number of commits, their authors and
+        the first and last timestamps. Commits not mentioning any issue are left out.
+    """
+    summaries = OrderedDict()
+    for commit in commitdata:
+        seen = set()
+        for issue in commit.issues:
+            key = (issue.link_template, issue.id)
+            if key in seen:
+                # Mentioned more than once in the same commit
+                continue
+            seen.add(key)
+            summary = summaries.get(key)
+            if summary is None:
+                summary = summaries[key] = OrderedDict([('issue', issue.id), ('display', issue.display),
+                                                        ('commits', 0), ('authors', OrderedDict()),
+                                                        ('first', None), ('last', None)])
+                if include_links:
+                    summary['link'] = generate_link_list(template=link_template, issues=[issue])[0]
+            summary['commits'] += 1
+            summary['authors'][commit.author] = None
+            _summary_times(summary, commit)
+    for summary in summaries.values():
+        summary['authors'] = list(summary['authors'])
+    return [_finish_summary(summary) for summary in summaries.values()]
 
 
-def get_repo(uri: str) -> Repo:
+def summarize_by_author(commitdata: [CommitRecord],
+                        include_links: bool = False,
+                        link_template: str = DEFAULT_LINK_TEMPLATE) -> [dict]:
     """
-    This take a path to a repo, local or remote and returns a pythongit Repo object
-    If the path is remote it fetches and refreshes as needed.
-    :param uri: Path to local or remote repo 
-    :return: Repo object
+    Group the commits of a range by author, in a single pass over the commits
+    :param commitdata: Iterable of CommitRecord objects, processed with issue matching
+    :param include_links: Boolean indicating weather we want to display issue links
+    :param link_template: Template used for issues without a template of their own
+    :return: List of dicts, one per author in order of first appearance, with the number of commits, the issues they
+        mention and the first and last timestamps
     """
+    summaries = OrderedDict()
+    for commit in commitdata:
+        summary = summaries.get(commit.author)
+        if summary is None:
+            summary = summaries[commit.author] = OrderedDict([('author', commit.author), ('commits', 0),
+                                                              ('issues', OrderedDict()),
+                                                              ('first', None), ('last', None)])
+        summary['commits'] += 1
+        for issue in commit.issues:
+            summary['issues'].setdefault((issue.link_template, issue.id), issue)
+        _summary_times(summary, commit)
+    for summary in summaries.values():
+        issues = list(summary['issues'].values())
+        summary['issues'] = [issue.display for issue in issues]
+        if include_links:
+            summary['issue_links'] = generate_link_list(template=link_template, issues=issues)
+    return [_finish_summary(summary) for summary in summaries.values()]
 
-    if is_local_repo(uri):
-        return Repo(uri)
 
-    cache_path = create_cache_path(uri=uri)
-    if os.path.isdir(cache_path):
-        repo = refresh_repo(cache_path)
-    else:
-        repo = clone_repo(url=uri, cache_path=cache_path)
-    return repo
+SUMMARIES = {
+    'issue': summarize_by_issue,
+    'author': summarize_by_author,
+}
 
 
-def process_commit(commit: Commit, include_links: bool, issue_id_matcher: str = DEFAULT_ISSUE_ID_MATCHER) -> CommitData:
+def stream_summaries_for_humans(summaries: [dict]):
     """
-    Convert and format commit object into Commitdata object for easier use
-    :param commit: The commit being worked on
-    :param include_links: Should we look for jira issues to link to later 
-    :param issue_id_matcher: Regex to identify Jira issues. Should return 'id' and 'display' groups 
-    :return: CommitData object
+    Format issue or author summaries in human pleasing way
+    :param summaries: List of dicts from summarize_by_issue or summarize_by_author
+    :return: Generator of string chunks suitable for output
     """
-    if include_links:
-        issues = [IssueData(id=found.group('id').lower(), display=found.group('display')) for found in
-                  re.finditer(re.compile(issue_id_matcher), commit.message)]
-    else:
-        issues = []
+    separator = ''
+    for summary in summaries:
+        lines = ["{name:40.40} {commits:6} commits {first} - {last}".format(
+            name=summary['display'] if 'issue' in summary else summary['author'], **summary)]
+        if 'issue' in summary:
+            lines.append('    Authors: ' + ', '.join(summary['authors']))
+            if 'link' in summary:
+                lines.append('    ' + summary['link'])
+        elif summary['issues']:
+            lines.append('    Issues: ' + ', '.join(summary['issues']))
+            lines.extend('    ' + link for link in summary.get('issue_links', ()))
+        yield separator + '\n'.join(lines) + '\n'
+        separator = '\n'
+
 
-    return CommitData(id=commit.binsha.hex(),
-                      author=commit.author.name,
-                      timestamp=commit.authored_datetime.strftime("%x %X"),
-                      messages=commit.message,
-                      issues=issues)
+def stream_summaries_for_json(summaries: [dict]):
+    """
+    Format issue or author summaries as a json array
+    :param summaries: List of dicts from summarize_by_issue or summarize_by_author
+    :return: Generator of string chunks which together form a json array
+    """
+    separator = '['
+    for summary in summaries:
+        yield separator + json.dumps(summary)
+        separator = ', '
+    yield '[]' if separator == '[' else ']'
 
 
-def generate_link_list(template: str, issues: [IssueData]) -> [str]:
+def stream_summaries_for_ndjson(summaries: [dict]):
     """
-    Applies link template to a list of Issues
-    :param template: 
-    :param issues: 
-    :return: List of rendered strings
+    Format issue or author summaries as newline delimited json, one object per summary
+    :param summaries: List of dicts from summarize_by_issue or summarize_by_author
+    :return: Generator of json lines
     """
-    return [template.format(**issue._asdict()) for issue in issues]
+    for summary in summaries:
+        yield json.dumps(summary) + '\n'
+
 
+# Summary formatter used in place of each commit formatter
+SUMMARY_FORMATTERS = {
+    stream_for_humans: stream_summaries_for_humans,
+    stream_for_json: stream_summaries_for_json,
+    stream_for_ndjson: stream_summaries_for_ndjson,
+}
 
-def format_for_humans(commitdata: CommitData,
+
+def format_for_humans(commitdata: [CommitData],
                       include_links: bool = False,
                       link_template: str = DEFAULT_LINK_TEMPLATE) -> str:
     """
@@ -120,24 +1687,10 @@ def format_for_humans(commitdata: CommitData,
     :param link_template: String which template to format Jira links
     :return: Multiline string suitable for output
     """
-
-    lines = []
-    for commit in commitdata:
-        message_padding = '\n' + (80 * ' ')
-        lines.append("{id} {author:20.20} {timestamp} {messages}".format(
-            id=commit.id,
-            author=commit.author,
-            timestamp=commit.timestamp,
-            messages=commit.messages.rstrip().replace('\n', message_padding)  # Line up multiple messages
-        ))
-        if include_links and commit.issues:
-            lines.append('Linked Jira Issues:')
-            lines.extend(generate_link_list(template=link_template, issues=commit.issues))
-        lines.append('')
-    return '\n'.join(lines)
+    return ''.join(stream_for_humans(commitdata, include_links, link_template))
 
 
-def format_for_json(commitdata: CommitData,
+def format_for_json(commitdata: [CommitData],
                     include_links: bool = False,
                     link_template: str = DEFAULT_LINK_TEMPLATE) -> str:
     """
@@ -147,17 +1700,134 @@ def format_for_json(commitdata: CommitData,
     :param link_template: String which template to format Jira links
     :return: json string in format
     """
+    return ''.join(stream_for_json(commitdata, include_links, link_template))
 
-    objs = []
-    for commit in commitdata:
-        obj = {"id": commit.id,
-               "author": commit.author,
-               "timestamp": commit.timestamp,
-               "messages": commit.messages}
-        if include_links and commit.issues:
-            obj['issue_links'] = generate_link_list(template=link_template, issues=commit.issues)
-        objs.append(obj)
-    return json.dumps(objs)
+
+class StageTimer:
+    """
+    Records wall time, item and byte counts and peak memory for the stages of a report. Stages nest, time spent in an
+    inner stage is not counted towards the outer one, so the streamed stages of the pipeline can be told apart even
+    though they run interleaved.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.last = self.started
+        self.stack = []
+        self.stages = OrderedDict()
+
+    def _entry(self, name: str) -> dict:
+        if name not in self.stages:
+            self.stages[name] = {'seconds': 0.0, 'items': 0, 'bytes': 0, 'peak_rss_bytes': None}
+        return self.stages[name]
+
+    def _charge(self):
+        now = time.perf_counter()
+        if self.stack:
+            self._entry(self.stack[-1])['seconds'] += now - self.last
+        self.last = now
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Time a block as a stage
+        :param name: Name of the stage
+        :return: Context manager
+        """
+        self._charge()
+        self.stack.append(name)
+        self._entry(name)
+        try:
+            yield
+        finally:
+            self._charge()
+            self.stack.pop()
+            self._entry(name)['peak_rss_bytes'] = peak_rss()
+
+    def iterate(self, name: str, iterable, size=None):
+        """
+        Time producing each item of an iterable as a stage
+        :param name: Name of the stage
+        :param iterable: Iterable to time
+        :param size: Optional function giving the number of bytes an item represents
+        :return: Generator of the iterable's items
+        """
+        iterator = iter(iterable)
+        entry = self._entry(name)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            entry['items'] += 1
+            if size is not None:
+                entry['bytes'] += size(item)
+            yield item
+
+    def writer(self, name: str, out):
+        """
+        Wrap a file like object so writing to it is timed as a stage
+        :param name: Name of the stage
+        :param out: File like object
+        :return: File like object
+        """
+        timer = self
+
+        class TimedWriter:
+            def write(self, text):
+                with timer.stage(name):
+                    written = out.write(text)
+                entry = timer._entry(name)
+                entry['items'] += 1
+                entry['bytes'] += len(text)
+                return written
+
+        return TimedWriter()
+
+    def summary(self) -> dict:
+        """
+        :return: Dict of the recorded stages, suitable for json
+        """
+        stages = OrderedDict((name, dict(entry, seconds=round(entry['seconds'], 6)))
+                             for name, entry in self.stages.items())
+        return {'total_seconds': round(time.perf_counter() - self.started, 6),
+                'peak_rss_bytes': peak_rss(),
+                'stages': stages}
+
+
+def peak_rss():
+    """
+    :return: Peak resident memory of this process in bytes, None where that is not available
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def raw_commit_size(raw: RawCommit) -> int:
+    """
+    :param raw: Commit read from the repo
+    :return: Approximate number of bytes read for it
+    """
+    return len(raw.author) + len(raw.message) + len(raw.binsha)
+
+
+def write_output(chunks, out=None) -> int:
+    """
+    Write formatted chunks to a stream as they are produced
+    :param chunks: Iterable of strings, or bytes for binary formatters
+    :param out: File like object to write to, stdout by default
+    :return: Number of characters, or bytes, written
+    """
+    out = out or sys.stdout
+    written = 0
+    for chunk in chunks:
+        out.write(chunk)
+        written += len(chunk)
+    return written
 
 
 def parse_args(args: [str]) -> argparse.Namespace:
@@ -172,18 +1842,32 @@ def parse_args(args: [str]) -> argparse.Namespace:
     validate_group.add_argument('--human',
                                 dest='formatter',
                                 action='store_const',
-                                const=format_for_humans,
+                                const=stream_for_humans,
                                 help='Human readable output (default)'
                                 )
 
     validate_group.add_argument('--json',
                                 dest='formatter',
                                 action='store_const',
-                                const=format_for_json,
+                                const=stream_for_json,
                                 help='Json formatted output'
                                 )
 
-    parser.set_defaults(formatter=format_for_humans)
+    validate_group.add_argument('--ndjson',
+                                dest='formatter',
+                                action='store_const',
+                                const=stream_for_ndjson,
+                                help='Newline delimited json output, one object per commit'
+                                )
+
+    validate_group.add_argument('--arrow',
+                                dest='formatter',
+                                action='store_const',
+                                const=stream_for_arrow,
+                                help='Arrow IPC stream output, needs pyarrow. Not available with --group-by.'
+                                )
+
+    parser.set_defaults(formatter=stream_for_humans)
 
     parser.add_argument('--issue-links',
                         dest='links',
@@ -191,18 +1875,164 @@ def parse_args(args: [str]) -> argparse.Namespace:
                         default=False,
                         help='Display links to issue tracker')
 
+    parser.add_argument('--path',
+                        dest='paths',
+                        action='append',
+                        default=[],
+                        help='Only report commits touching this path, a git pathspec. May be repeated.')
+
+    parser.add_argument('--author',
+                        dest='authors',
+                        action='append',
+                        default=[],
+                        metavar='PATTERN',
+                        help='Only report commits by authors matching this regex. May be repeated.')
+
+    parser.add_argument('--grep',
+                        dest='grep',
+                        action='append',
+                        default=[],
+                        metavar='PATTERN',
+                        help='Only report commits with messages matching this regex. May be repeated.')
+
+    merges_group = parser.add_mutually_exclusive_group(required=False)
+    merges_group.add_argument('--merges',
+                              dest='merges',
+                              action='store_const',
+                              const=True,
+                              help='Only report merge commits')
+
+    merges_group.add_argument('--no-merges',
+                              dest='merges',
+                              action='store_const',
+                              const=False,
+                              help='Leave out merge commits')
+
+    parser.set_defaults(merges=None)
+
+    parser.add_argument('--group-by',
+                        dest='group_by',
+                        action='store',
+                        choices=['commit'] + sorted(SUMMARIES),
+                        default='commit',
+                        help='Report each commit, or summarize the commits of each issue or author '
+                             '(Default: "%(default)s")')
+
     parser.add_argument('--issue-matcher',
                         dest='issue_id_regex',
                         action='store',
                         default=DEFAULT_ISSUE_ID_MATCHER,
                         help='Regex describing issue identifiers (Default: "%(default)s")')
 
+    parser.add_argument('--issue-tracker',
+                        dest='issue_trackers',
+                        action='append',
+                        nargs=3,
+                        default=[],
+                        metavar=('NAME', 'REGEX', 'LINK_TEMPLATE'),
+                        help='Additional issue tracker, matched along with --issue-matcher. May be repeated.')
+
     parser.add_argument('--link-template',
                         dest='link_template',
                         action='store',
                         default=DEFAULT_LINK_TEMPLATE,
                         help='Format strong for issue links (Default: "%(default)s")')
 
+    parser.add_argument('--backend',
+                        dest='backend',
+                        action='store',
+                        choices=sorted(COMMIT_BACKENDS),
+                        default=DEFAULT_BACKEND,
+                        help='How commits are read from the repo (Default: "%(default)s")')
+
+    metadata_cache_group = parser.add_mutually_exclusive_group(required=False)
+    metadata_cache_group.add_argument('--metadata-cache',
+                                      dest='metadata_cache',
+                                      action='store_const',
+                                      const=True,
+                                      help='Read commits from the local commit metadata cache when possible '
+                                           '(Default: only with the {} backend)'.format(
+                                          ', '.join(METADATA_CACHE_BACKENDS)))
+
+    metadata_cache_group.add_argument('--no-metadata-cache',
+                                      dest='metadata_cache',
+                                      action='store_const',
+                                      const=False,
+                                      help='Always read commits from the repo instead of the local commit metadata '
+                                           'cache')
+
+    parser.set_defaults(metadata_cache=None)
+
+    parser.add_argument('--metadata-cache-size',
+                        dest='metadata_cache_size',
+                        action='store',
+                        type=int,
+                        default=DEFAULT_METADATA_CACHE_SIZE,
+                        help='Size limit of the commit metadata cache in megabytes (Default: "%(default)s")')
+
+    parser.add_argument('--clone-filter',
+                        dest='clone_filter',
+                        action='store',
+                        default=DEFAULT_CLONE_FILTER,
+                        help='Partial clone filter used when caching remote repos, "none" for full clones '
+                             '(Default: "%(default)s")')
+
+    parser.add_argument('--no-shared-objects',
+                        dest='shared_objects',
+                        action='store_false',
+                        default=True,
+                        help='Give a newly cached remote repo objects of its own instead of sharing them with cached '
+                             'forks and mirrors of the same project')
+
+    parser.add_argument('--fetch-ttl',
+                        dest='fetch_ttl',
+                        action='store',
+                        type=int,
+                        default=DEFAULT_FETCH_TTL,
+                        help='Seconds after a fetch during which cached branches and tags are used without fetching '
+                             'again. Commits named by sha are never fetched once cached. (Default: "%(default)s")')
+
+    parser.add_argument('--fetch-timeout',
+                        dest='fetch_timeout',
+                        action='store',
+                        type=float,
+                        default=DEFAULT_FETCH_TIMEOUT,
+                        help='Seconds after which fetching a cached repo is given up and the report made from the '
+                             'cached copy, 0 for no limit (Default: "%(default)s")')
+
+    parser.add_argument('--jobs',
+                        dest='jobs',
+                        action='store',
+                        type=int,
+                        default=DEFAULT_JOBS,
+                        help='Read and process commits in this many worker processes, not used with --incremental '
+                             '(Default: "%(default)s")')
+
+    parser.add_argument('--incremental',
+                        dest='incremental',
+                        action='store_true',
+                        default=False,
+                        help='Keep a checkpoint of this range and on later runs only walk the commits added since')
+
+    parser.add_argument('--timings',
+                        dest='timings',
+                        action='store_true',
+                        default=False,
+                        help='Write the time, commit and byte counts and peak memory of each report stage to stderr '
+                             'as json')
+
+    parser.add_argument('--timings-file',
+                        dest='timings_file',
+                        action='store',
+                        default=None,
+                        help='Write the stage timings to this file instead of stderr')
+
+    parser.add_argument('--profile',
+                        dest='profile',
+                        action='store',
+                        default=None,
+                        help='Profile the report with cProfile and write the pstats data to this file')
+
     parser.add_argument('repo', metavar='REPO_URI/PATH', help='Git repo to analyze')
     parser.add_argument(dest='start', metavar='START_COMMIT', help='commit range start')
     parser.add_argument(dest='end', metavar='END_COMMIT', help='commit range end')
@@ -211,7 +2041,140 @@ def parse_args(args: [str]) -> argparse.Namespace:
         parser.print_help()
         sys.exit(1)
 
-    return parser.parse_args(args=args)
+    parsed_args = parser.parse_args(args=args)
+    if parsed_args.group_by != 'commit' and parsed_args.formatter not in SUMMARY_FORMATTERS:
+        parser.error('--group-by {} is not available with this output format'.format(parsed_args.group_by))
+    return parsed_args
+
+
+def clone_filter(parsed_args: argparse.Namespace):
+    """
+    :param parsed_args: Options as returned by parse_args
+    :return: The partial clone filter to use, None for a full clone
+    """
+    return None if parsed_args.clone_filter == 'none' else parsed_args.clone_filter
+
+
+def get_report_repo(parsed_args: argparse.Namespace, fetch: bool = True, revs: [str] = None) -> 'Repo':
+    """
+    Get the repo a report is for, fetching only what its range needs
+    :param parsed_args: Options as returned by parse_args
+    :param fetch: Refresh an already cached remote repo
+    :param revs: Revisions to fetch, by default the start and end of the report's range
+    :return: Repo object
+    """
+    return get_repo(parsed_args.repo, fetch=fetch, revs=revs or (parsed_args.start, parsed_args.end),
+                    clone_filter=clone_filter(parsed_args), fetch_ttl=parsed_args.fetch_ttl,
+                    fetch_timeout=parsed_args.fetch_timeout, shared_objects=parsed_args.shared_objects)
+
+
+def use_metadata_cache(parsed_args: argparse.Namespace) -> bool:
+    """
+    :param parsed_args: Options as returned by parse_args
+    :return: True if the report reads commits through the metadata cache
+    """
+    if parsed_args.metadata_cache is None:
+        return parsed_args.backend in METADATA_CACHE_BACKENDS
+    return parsed_args.metadata_cache
+
+
+def report_rev_filter(parsed_args: argparse.Namespace):
+    """
+    :param parsed_args: Options as returned by parse_args
+    :return: RevFilter for the report's filter options, None when there are none
+    """
+    rev_filter = RevFilter(paths=tuple(parsed_args.paths), authors=tuple(parsed_args.authors),
+                           grep=tuple(parsed_args.grep), merges=parsed_args.merges)
+    return rev_filter if rev_filter != RevFilter() else None
+
+
+def generate_report(repo: 'Repo', parsed_args: argparse.Namespace, out=None, timer: StageTimer = None) -> int:
+    """
+    Walk the requested range and write the formatted report
+    :param repo: Repo to report on
+    :param parsed_args: Options as returned by parse_args
+    :param out: File like object to write to, stdout by default
+    :param timer: Optional StageTimer recording each stage of the report
+    :return: Number of characters written
+    """
+    out = out or sys.stdout
+    binary = parsed_args.formatter in BINARY_FORMATTERS
+    if binary:
+        # Write bytes underneath text streams such as stdout
+        out = getattr(out, 'buffer', out)
+    cache = open_metadata_cache(DEFAULT_METADATA_CACHE) if use_metadata_cache(parsed_args) else None
+    rev_filter = report_rev_filter(parsed_args)
+
+    def walk(rev):
+        if cache:
+            return iter_commits_cached(repo, rev, parsed_args.backend, cache, rev_filter)
+        return COMMIT_BACKENDS[parsed_args.backend](repo, rev, rev_filter)
+
+    # Summaries are built from the issues of each commit, and Arrow output always has an issues column. Otherwise they
+    # are only matched when links are shown.
+    match_issues = parsed_args.links or parsed_args.group_by != 'commit' or parsed_args.formatter is stream_for_arrow
+    if parsed_args.jobs > 1 and not parsed_args.incremental:
+        binshas = iter_range_shas(repo, commit_range(parsed_args.start, parsed_args.end), rev_filter)
+        if timer:
+            binshas = timer.iterate('range_walk', binshas)
+        processed_commits = process_commits_parallel(
+            repo, binshas, parsed_args.jobs, parsed_args.backend, match_issues, parsed_args.issue_id_regex,
+            parsed_args.issue_trackers, DEFAULT_METADATA_CACHE if cache else None)
+    else:
+        if parsed_args.incremental:
+            commit_iter = iter_commits_incremental(repo, parsed_args.repo, parsed_args.start, parsed_args.end, walk,
+                                                   checkpoints=DEFAULT_CHECKPOINTS, rev_filter=rev_filter)
+        else:
+            commit_iter = walk(commit_range(parsed_args.start, parsed_args.end))
+        if timer:
+            commit_iter = timer.iterate('range_walk', commit_iter, size=raw_commit_size)
+        issue_matcher = build_issue_matcher(parsed_args.issue_id_regex, parsed_args.issue_trackers)
+        processed_commits = (process_raw_commit(raw, match_issues, issue_id_matcher=issue_matcher, timer=timer)
+                             for raw in commit_iter)
+    if timer:
+        processed_commits = timer.iterate('commit_processing', processed_commits)
+    if parsed_args.group_by == 'commit':
+        chunks = parsed_args.formatter(processed_commits, parsed_args.links, parsed_args.link_template)
+    else:
+        chunks = summary_chunks(processed_commits, parsed_args)
+    if timer:
+        chunks = timer.iterate('formatting', chunks)
+        out = timer.writer('output', out)
+    with reading_repo(parsed_args.repo):
+        written = write_output(chunks, out)
+    if parsed_args.formatter is not stream_for_ndjson and not binary:
+        out.write('\n')
+        written += 1
+    if cache:
+        trim_metadata_cache(cache, parsed_args.metadata_cache_size)
+        cache.close()
+    return written
+
+
+def summary_chunks(commitdata: [CommitRecord], parsed_args: argparse.Namespace):
+    """
+    Summarize the commits as selected by --group-by and format the summaries
+    :param commitdata: Iterable of CommitRecord objects, processed with issue matching
+    :param parsed_args: Options as returned by parse_args
+    :return: Generator of string chunks, nothing is read until it is iterated
+    """
+    summaries = SUMMARIES[parsed_args.group_by](commitdata, parsed_args.links, parsed_args.link_template)
+    yield from SUMMARY_FORMATTERS[parsed_args.formatter](summaries)
+
+
+def write_timings(timer: StageTimer, path: str = None):
+    """
+    Write the recorded timings as json
+    :param timer: StageTimer used for the report
+    :param path: File to write to, stderr when None
+    :return: None
+    """
+    timings = json.dumps(timer.summary(), indent=2)
+    if path:
+        with open(path, 'w') as timings_file:
+            timings_file.write(timings + '\n')
+    else:
+        sys.stderr.write(timings + '\n')
 
 
 def do_it(args: [str]):
@@ -222,15 +2185,442 @@ def do_it(args: [str]):
     """
     try:
         parsed_args = parse_args(args)
-        repo = get_repo(parsed_args.repo)
-        commit_iter = repo.iter_commits(rev='{start}...{end}'.format(start=parsed_args.start, end=parsed_args.end))
-        processed_commits = [process_commit(commit, parsed_args.links, issue_id_matcher=parsed_args.issue_id_regex) for
-                             commit in commit_iter]
-        print(parsed_args.formatter(processed_commits, parsed_args.links, parsed_args.link_template))
+        timer = StageTimer() if parsed_args.timings or parsed_args.timings_file else None
+        profiler = None
+        if parsed_args.profile:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        if timer:
+            with timer.stage('fetch'):
+                repo = get_report_repo(parsed_args)
+        else:
+            repo = get_report_repo(parsed_args)
+        generate_report(repo, parsed_args, timer=timer)
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(parsed_args.profile)
+        if timer:
+            write_timings(timer, parsed_args.timings_file)
     except Exception as e:
         print('Sorry, we ran into the following error: {}'.format(e))
         traceback.print_exc()
         exit(1)
 
+
+def parse_batch_args(args: [str]) -> argparse.Namespace:
+    """
+    Parse command line arguments of the batch command
+    :param args: Commandline arguments, without the leading 'batch'
+    :return: Namespace object containing parsed arguments
+    """
+    parser = argparse.ArgumentParser(prog='commit_report.py batch',
+                                     description='Generate reports for every job listed in a manifest')
+    parser.add_argument('--output-dir',
+                        dest='output_dir',
+                        action='store',
+                        default=DEFAULT_BATCH_OUTPUT_DIR,
+                        help='Directory the reports and summary are written to (Default: "%(default)s")')
+    parser.add_argument('--fetch-workers',
+                        dest='fetch_workers',
+                        action='store',
+                        type=int,
+                        default=DEFAULT_FETCH_WORKERS,
+                        help='Number of remotes fetched at the same time (Default: "%(default)s")')
+    parser.add_argument('--workers',
+                        dest='workers',
+                        action='store',
+                        type=int,
+                        default=None,
+                        help='Number of reports generated at the same time (Default: number of CPUs)')
+    parser.add_argument('manifest', metavar='MANIFEST',
+                        help='Json file holding a list of jobs, each with "repo", "start" and "end" and optionally '
+                             '"format" ({}), "output" and "args", a list of extra report options'.format(
+                            ', '.join(sorted(BATCH_FORMATS))))
+    return parser.parse_args(args=args)
+
+
+def load_manifest(path: str) -> [dict]:
+    """
+    Read a batch manifest and fill in defaults
+    :param path: Location of the json manifest, either a list of jobs or an object with a "jobs" list
+    :return: List of job dicts, each with "args" ready for parse_args and an "output" file name
+    """
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    if isinstance(manifest, dict):
+        manifest = manifest['jobs']
+
+    jobs = []
+    for index, job in enumerate(manifest):
+        job_format = job.get('format', 'human')
+        if job_format not in BATCH_FORMATS:
+            raise ValueError('Job {} has unknown format "{}"'.format(index, job_format))
+        jobs.append({'repo': job['repo'],
+                     'start': job['start'],
+                     'end': job['end'],
+                     'format': job_format,
+                     'output': job.get('output', 'job-{}.{}'.format(index, BATCH_FORMATS[job_format])),
+                     'args': ['--' + job_format] + list(job.get('args', [])) + [job['repo'], job['start'],
+                                                                                 job['end']]})
+    return jobs
+
+
+def parse_job_args(job: dict) -> argparse.Namespace:
+    """
+    Parse the report options of one batch job, without exiting when they are invalid
+    :param job: Job dict from load_manifest
+    :return: Namespace object containing parsed arguments
+    :raises ValueError: The options are invalid, with the error argparse gave
+    """
+    errors = io.StringIO()
+    try:
+        with redirect_stderr(errors):
+            return parse_args(job['args'])
+    except SystemExit:
+        lines = errors.getvalue().strip().splitlines()
+        raise ValueError('Invalid report options: {}'.format(lines[-1] if lines else ' '.join(job['args'])))
+
+
+def batch_job_error(job: dict, error: str) -> dict:
+    """
+    :param job: Job dict from load_manifest
+    :param error: Why the job failed
+    :return: Summary of a job which was not run
+    """
+    return {'repo': job['repo'], 'start': job['start'], 'end': job['end'], 'status': 'error', 'error': error}
+
+
+def run_batch_job(job: dict, output_dir: str) -> dict:
+    """
+    Generate the report for one batch job. Remote repos must already be cached, they are not fetched again.
+    :param job: Job dict from load_manifest
+    :param output_dir: Directory the report is written to
+    :return: Summary of the job
+    """
+    started = time.time()
+    summary = {'repo': job['repo'], 'start': job['start'], 'end': job['end'],
+               'output': os.path.join(output_dir, job['output'])}
+    try:
+        parsed_args = parse_job_args(job)
+        repo = get_report_repo(parsed_args, fetch=False)
+        with open(summary['output'], 'wb' if parsed_args.formatter in BINARY_FORMATTERS else 'w') as out:
+            summary['characters'] = generate_report(repo, parsed_args, out)
+        summary['status'] = 'ok'
+    except Exception as e:
+        summary['status'] = 'error'
+        summary['error'] = str(e)
+    summary['seconds'] = round(time.time() - started, 3)
+    return summary
+
+
+def do_batch(args: [str]):
+    """
+    Generate reports for every job in a manifest. Each remote is fetched once, however many jobs use it, and the
+    fetches and reports run in parallel.
+    :param args: Arguments passed in, without the leading 'batch'
+    :return: None
+    """
+    parsed_args = parse_batch_args(args)
+    jobs = load_manifest(parsed_args.manifest)
+    os.makedirs(parsed_args.output_dir, exist_ok=True)
+
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    # A job with invalid options fails on its own, the others still run
+    summaries = [None] * len(jobs)
+    options = {}
+    for index, job in enumerate(jobs):
+        try:
+            options[index] = parse_job_args(job)
+        except ValueError as e:
+            summaries[index] = batch_job_error(job, str(e))
+
+    # Every remote is fetched once, for the endpoints of all of its jobs
+    remotes = {}
+    for index, job_options in options.items():
+        job = jobs[index]
+        if not is_local_repo(job['repo']):
+            remote = remotes.setdefault(job['repo'], {'revs': [], 'options': job_options})
+            remote['revs'].extend((job['start'], job['end']))
+    fetch_errors = {}
+    with ThreadPoolExecutor(max_workers=max(1, parsed_args.fetch_workers)) as executor:
+        fetches = dict((uri, executor.submit(get_repo, uri, revs=remote['revs'],
+                                             clone_filter=clone_filter(remote['options']),
+                                             fetch_ttl=remote['options'].fetch_ttl,
+                                             fetch_timeout=remote['options'].fetch_timeout,
+                                             shared_objects=remote['options'].shared_objects))
+                       for uri, remote in remotes.items())
+        for uri, future in fetches.items():
+            if future.exception() is not None:
+                fetch_errors[uri] = 'Fetch failed: {}'.format(future.exception())
+
+    with ProcessPoolExecutor(max_workers=parsed_args.workers) as executor:
+        reports = {}
+        for index in options:
+            job = jobs[index]
+            if job['repo'] in fetch_errors:
+                summaries[index] = batch_job_error(job, fetch_errors[job['repo']])
+            else:
+                reports[index] = executor.submit(run_batch_job, job, parsed_args.output_dir)
+        for index, future in reports.items():
+            summaries[index] = future.result()
+
+    summary = json.dumps(summaries, indent=2)
+    with open(os.path.join(parsed_args.output_dir, 'summary.json'), 'w') as summary_file:
+        summary_file.write(summary)
+    print(summary)
+    if any(job_summary['status'] != 'ok' for job_summary in summaries):
+        exit(1)
+
+
+class PendingRefresh:
+    """
+    A refresh of one remote for the RepoPool. Requests arriving before it starts add the revisions they need and
+    share its result.
+    """
+    __slots__ = ('revs', 'started', 'result')
+
+    def __init__(self):
+        from concurrent.futures import Future
+        self.revs = []
+        self.started = False
+        self.result = Future()
+
+
+class RepoPool:
+    """
+    Keeps the most recently used repos open between reports, so their GitPython object database and git cat-file
+    processes stay warm. Concurrent requests to refresh the same remote share a single fetch, covering the ranges of
+    all of them, and no more than fetch_workers repos are refreshed at a time.
+    """
+
+    def __init__(self, size: int = DEFAULT_REPO_POOL_SIZE, fetch_workers: int = DEFAULT_FETCH_WORKERS):
+        self.size = size
+        self.repos = OrderedDict()
+        self.refreshes = {}
+        self.lock = threading.Lock()
+        self.fetch_slots = threading.BoundedSemaphore(max(1, fetch_workers))
+
+    def get(self, parsed_args: argparse.Namespace):
+        """
+        Get the repo a report is for, refreshed as get_report_repo would. The fetch and clone options of the request
+        starting a refresh apply to the requests sharing it.
+        :param parsed_args: Options as returned by parse_args
+        :return: Tuple of the Repo and a lock which must be held while a backend outside CONCURRENT_BACKENDS uses it
+        """
+        with self.lock:
+            refresh = self.refreshes.get(parsed_args.repo)
+            # A refresh already under way may have asked for other revisions, a new one follows it
+            owner = refresh is None or refresh.started
+            if owner:
+                refresh = self.refreshes[parsed_args.repo] = PendingRefresh()
+            refresh.revs.extend((parsed_args.start, parsed_args.end))
+        if owner:
+            try:
+                with self.fetch_slots:
+                    with self.lock:
+                        refresh.started = True
+                    refresh.result.set_result(get_report_repo(parsed_args, revs=refresh.revs))
+            except Exception as e:
+                refresh.result.set_exception(e)
+            finally:
+                with self.lock:
+                    if self.refreshes.get(parsed_args.repo) is refresh:
+                        del self.refreshes[parsed_args.repo]
+        fresh = refresh.result.result()
+
+        with self.lock:
+            entry = self.repos.pop(parsed_args.repo, None)
+            if entry is None:
+                entry = (fresh, threading.Lock())
+            elif entry[0] is not fresh and owner:
+                close_repo(fresh)
+            self.repos[parsed_args.repo] = entry
+            while len(self.repos) > self.size:
+                self._evict(self.repos.popitem(last=False)[1])
+        return entry
+
+    @staticmethod
+    def _evict(entry):
+        repo, repo_lock = entry
+        # A repo still being reported on is left for the garbage collector to close. Reports with CONCURRENT_BACKENDS
+        # do not take the lock, closing the repo does not stop the git processes they run.
+        if repo_lock.acquire(False):
+            close_repo(repo)
+            repo_lock.release()
+
+    def close(self):
+        with self.lock:
+            while self.repos:
+                self._evict(self.repos.popitem()[1])
+
+
+def close_repo(repo: 'Repo'):
+    """
+    Stop any git processes a repo has running
+    :param repo: Repo to close
+    :return: None
+    """
+    if hasattr(repo, 'close'):
+        repo.close()
+    else:
+        repo.git.clear_cache()
+
+
+class ReportRequestHandler:
+    """
+    Serves reports at /report?repo=...&start=...&end=...&format=json&links=1. Any other report option can be passed
+    with repeated 'arg' parameters, for example arg=--backend&arg=gitpython.
+    create_server mixes this into BaseHTTPRequestHandler, so http.server is only imported when serving.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/report':
+            self.send_error(404)
+            return
+        query = parse_qs(url.query)
+        report_format = query.get('format', ['human'])[0]
+        if report_format not in SERVE_CONTENT_TYPES or not all(query.get(name) for name in ('repo', 'start', 'end')):
+            self.send_error(400, 'repo, start and end are required and format must be one of {}'.format(
+                ', '.join(sorted(SERVE_CONTENT_TYPES))))
+            return
+        options = query.get('arg', [])
+        positionals = [query[name][0] for name in ('repo', 'start', 'end')]
+        # Anything after '--', or starting with '-', would reach git as one of its options
+        if '--' in options or any(value.startswith('-') for value in positionals):
+            self.send_error(400, 'Invalid report options')
+            return
+        args = ['--' + report_format] + options
+        if query.get('links', ['0'])[0] not in ('', '0', 'false'):
+            args.append('--issue-links')
+        args.extend(positionals)
+        try:
+            parsed_args = parse_args(args)
+        except SystemExit:
+            self.send_error(400, 'Invalid report options')
+            return
+
+        # Errors have a fixed reason, git's messages span several lines and go in the body
+        try:
+            repo, repo_lock = self.server.pool.get(parsed_args)
+        except Exception as e:
+            self.send_error(500, 'Could not get the repo', str(e))
+            return
+        # Once the response has started a failure can no longer be reported, a bad range would look like an empty one
+        unknown = [rev for rev in (parsed_args.start, parsed_args.end) if not resolves_locally(repo, rev)]
+        if unknown:
+            self.send_error(404, 'Unknown revision', 'No commit named {}'.format(' or '.join(unknown)))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', SERVE_CONTENT_TYPES[report_format])
+        self.end_headers()
+        with unlocked() if parsed_args.backend in CONCURRENT_BACKENDS else repo_lock:
+            try:
+                if parsed_args.formatter in BINARY_FORMATTERS:
+                    generate_report(repo, parsed_args, self.wfile)
+                else:
+                    generate_report(repo, parsed_args, codecs.getwriter('utf-8')(self.wfile))
+            except Exception as e:
+                self.log_error('Report failed: %s', e)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+
+def parse_serve_args(args: [str]) -> argparse.Namespace:
+    """
+    Parse command line arguments of the serve command
+    :param args: Commandline arguments, without the leading 'serve'
+    :return: Namespace object containing parsed arguments
+    """
+    parser = argparse.ArgumentParser(prog='commit_report.py serve',
+                                     description='Serve reports over HTTP, keeping repos open between requests')
+    parser.add_argument('--host',
+                        dest='host',
+                        action='store',
+                        default=DEFAULT_SERVE_HOST,
+                        help='Address to listen on (Default: "%(default)s")')
+    parser.add_argument('--port',
+                        dest='port',
+                        action='store',
+                        type=int,
+                        default=DEFAULT_SERVE_PORT,
+                        help='Port to listen on (Default: "%(default)s")')
+    parser.add_argument('--unix-socket',
+                        dest='unix_socket',
+                        action='store',
+                        default=None,
+                        help='Listen on a unix socket at this path instead of a TCP port')
+    parser.add_argument('--pool-size',
+                        dest='pool_size',
+                        action='store',
+                        type=int,
+                        default=DEFAULT_REPO_POOL_SIZE,
+                        help='Number of repos kept open (Default: "%(default)s")')
+    parser.add_argument('--fetch-workers',
+                        dest='fetch_workers',
+                        action='store',
+                        type=int,
+                        default=DEFAULT_FETCH_WORKERS,
+                        help='Number of repos fetched at the same time (Default: "%(default)s")')
+    return parser.parse_args(args=args)
+
+
+def create_server(parsed_args: argparse.Namespace):
+    """
+    Create, but do not start, the report server
+    :param parsed_args: Options as returned by parse_serve_args
+    :return: Server object
+    """
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn, UnixStreamServer
+    handler = type('ReportRequestHandler', (ReportRequestHandler, BaseHTTPRequestHandler), {})
+    if parsed_args.unix_socket:
+        if os.path.exists(parsed_args.unix_socket):
+            os.unlink(parsed_args.unix_socket)
+        server_class, address = UnixStreamServer, parsed_args.unix_socket
+    else:
+        server_class, address = HTTPServer, (parsed_args.host, parsed_args.port)
+    server = type('ReportServer', (ThreadingMixIn, server_class), {'daemon_threads': True})(address, handler)
+    server.pool = RepoPool(parsed_args.pool_size, parsed_args.fetch_workers)
+    return server
+
+
+def do_serve(args: [str]):
+    """
+    Serve reports until interrupted
+    :param args: Arguments passed in, without the leading 'serve'
+    :return: None
+    """
+    server = create_server(parse_serve_args(args))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.pool.close()
+
+
+COMMANDS = {
+    'batch': do_batch,
+    'serve': do_serve,
+}
+
+
+def main(args: [str]):
+    """
+    Run a sub command, or a single report when the first argument is not a known command
+    :param args: Arguments passed in
+    :return: None
+    """
+    if args and args[0] in COMMANDS:
+        COMMANDS[args[0]](args[1:])
+    else:
+        do_it(args)
+
+
 if __name__ == '__main__':
-    do_it(argv[1:])
+    main(argv[1:])
@@ -1,4 +1,7 @@
 import argparse
+import importlib.util
+import inspect
+import io
 import json
 import os
 import sys
@@ -6,15 +9,61 @@ import textwrap
 import unittest
 from unittest.mock import patch
 import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import typing
+from urllib.request import urlopen
 from git import Repo
 
 __author__ = 'tim'
 
 import commit_report
 
+EMPTY_TREE = '4b825dc642cb6eb9a060e54bf8d69288fbee4904'
+
+
+def make_commit(repo, message, *parents, day=1, tree=EMPTY_TREE):
+    """
+    Create a commit dated 2017-01-<day>, of the empty tree unless given one, without touching any ref
+    """
+    date = '2017-01-{:02d}T12:00:00'.format(day)
+    env = {'GIT_AUTHOR_NAME': 'Tim', 'GIT_AUTHOR_EMAIL': 'tim@example.com', 'GIT_AUTHOR_DATE': date,
+           'GIT_COMMITTER_NAME': 'Tim', 'GIT_COMMITTER_EMAIL': 'tim@example.com', 'GIT_COMMITTER_DATE': date}
+    options = [option for parent in parents for option in ('-p', parent)]
+    return repo.git.commit_tree(tree, *options, m=message, env=env)
+
+
+def make_tree(repo, files):
+    """
+    Write a tree holding the given files
+    :param files: Dict of file name to text content
+    """
+    entries = []
+    for name, content in sorted(files.items()):
+        blob = subprocess.check_output(['git', 'hash-object', '-w', '--stdin'], input=content.encode('utf-8'),
+                                       cwd=repo.git_dir).decode('ascii').strip()
+        entries.append('100644 blob {}\t{}\n'.format(blob, name))
+    return subprocess.check_output(['git', 'mktree'], input=''.join(entries).encode('utf-8'),
+                                   cwd=repo.git_dir).decode('ascii').strip()
+
+
+def isolate_caches(test: unittest.TestCase):
+    """
+    Point the metadata cache and checkpoints of reports run by a test at a temporary directory
+    """
+    tmp = tempfile.TemporaryDirectory()
+    test.addCleanup(tmp.cleanup)
+    for name, path in (('DEFAULT_METADATA_CACHE', 'metadata.sqlite'), ('DEFAULT_CHECKPOINTS', 'checkpoints.sqlite')):
+        patcher = patch('commit_report.' + name, os.path.join(tmp.name, path))
+        patcher.start()
+        test.addCleanup(patcher.stop)
+
 
 class TestRepo(unittest.TestCase):
     def setUp(self):
+        isolate_caches(self)
         self.local_repo = 'test/test.git'
         self.remote_repo = 'git@git-server:test.git'
         self.cache_path = '.cache/Z2l0QGdpdC1zZXJ2ZXI6dGVzdC5naXQ='
@@ -50,6 +99,40 @@ class TestRepo(unittest.TestCase):
             commit_report.get_repo(self.remote_repo)
             self.assertEqual(patched.call_count, 1)
 
+    def test_repo_remote_cached_shas(self):
+        commit_report.get_repo(self.remote_repo)
+        # Both ends are shas already in the cache, nothing to fetch
+        with patch('commit_report.refresh_repo') as patched:
+            commit_report.get_repo(self.remote_repo, revs=(self.commit_start, self.commit_end))
+            self.assertEqual(patched.call_count, 0)
+        # Branches are fetched unless the last fetch is within the ttl
+        with patch('commit_report.refresh_repo') as patched:
+            commit_report.get_repo(self.remote_repo, revs=(self.commit_start, 'master'))
+            self.assertEqual(patched.call_args[1]['revs'], ['master'])
+        with patch('commit_report.refresh_repo') as patched:
+            commit_report.get_repo(self.remote_repo, revs=(self.commit_start, 'master'), fetch_ttl=3600)
+            self.assertEqual(patched.call_count, 0)
+
+    def test_revs_to_fetch(self):
+        repo = commit_report.clone_repo(url=self.remote_repo, cache_path=self.cache_path)
+        self.assertIsNone(commit_report.revs_to_fetch(repo, ()))
+        self.assertEqual(commit_report.revs_to_fetch(repo, [self.commit_start, 'a' * 40]), ['a' * 40])
+        os.utime(os.path.join(repo.git_dir, commit_report.FETCH_STAMP), (0, 0))
+        self.assertEqual(commit_report.revs_to_fetch(repo, ['master'], fetch_ttl=3600), ['master'])
+
+        # Fetching one branch says nothing about the others
+        repo.git.branch('release', self.commit_start)
+        commit_report.record_fetch(repo, ['master'])
+        self.assertEqual(commit_report.revs_to_fetch(repo, ['origin/master~1', 'release'], fetch_ttl=3600),
+                         ['release'])
+        commit_report.record_fetch(repo)
+        self.assertEqual(commit_report.revs_to_fetch(repo, ['master', 'release'], fetch_ttl=3600), [])
+
+    def test_rev_ref_name(self):
+        self.assertEqual(commit_report.rev_ref_name('origin/release/1.0~2'), 'release/1.0')
+        self.assertEqual(commit_report.rev_ref_name('v1.0^{commit}'), 'v1.0')
+        self.assertIsNone(commit_report.rev_ref_name('HEAD~1'))
+
     def test_clone_repo(self):
         self.assertFalse(os.path.isdir(self.cache_path), msg='Test environment not clean')
         repo = commit_report.clone_repo(url=self.remote_repo, cache_path=self.cache_path)
@@ -57,15 +140,164 @@ class TestRepo(unittest.TestCase):
         self.assertTrue(os.path.isdir(self.cache_path))
         self.assertIsInstance(repo, Repo)
 
+    def test_clone_repo_concurrent(self):
+        with patch('commit_report.clone_repo', wraps=commit_report.clone_repo) as patched:
+            threads = [threading.Thread(target=commit_report.get_repo, args=(self.remote_repo,)) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(patched.call_count, 1)
+        self.assertEqual(Repo(self.cache_path).commit(self.commit_end).hexsha, self.commit_end)
+        # The temporary clone directory was moved into place
+        self.assertEqual([name for name in os.listdir(os.path.dirname(self.cache_path)) if name.startswith('.clone-')],
+                         [])
+
+    def test_repo_lock(self):
+        acquired = []
+
+        def take_exclusive():
+            with commit_report.repo_lock(self.cache_path, exclusive=True):
+                acquired.append('exclusive')
+
+        with commit_report.repo_lock(self.cache_path, exclusive=False):
+            # Other readers are not blocked
+            with commit_report.repo_lock(self.cache_path, exclusive=False):
+                acquired.append('shared')
+            writer = threading.Thread(target=take_exclusive)
+            writer.start()
+            time.sleep(0.1)
+            self.assertEqual(acquired, ['shared'])
+        writer.join()
+        self.assertEqual(acquired, ['shared', 'exclusive'])
+
     def test_refresh_repo(self):
         # Need to make sure already have a copy of the repo
         commit_report.get_repo(uri=self.remote_repo)
 
         # Confirm we are starting clean (no previous fetches)
-        self.assertFalse(os.path.exists(self.cache_path + '/.git/FETCH_HEAD'))
+        self.assertFalse(os.path.exists(self.cache_path + '/FETCH_HEAD'))
 
         repo = commit_report.refresh_repo(path=self.cache_path)
-        self.assertTrue(os.path.exists(self.cache_path + '/.git/FETCH_HEAD'))
+        self.assertTrue(os.path.exists(self.cache_path + '/FETCH_HEAD'))
+
+    def test_clone_repo_bare(self):
+        repo = commit_report.clone_repo(url=self.remote_repo, cache_path=self.cache_path)
+        self.assertTrue(repo.bare)
+        self.assertEqual(repo.git.config('--get-all', 'remote.origin.fetch').splitlines(),
+                         list(commit_report.CACHE_FETCH_REFSPECS))
+        self.assertEqual(repo.commit('master').hexsha, repo.commit('origin/master').hexsha)
+
+    def test_commit_graph(self):
+        repo = commit_report.clone_repo(url=self.remote_repo, cache_path=self.cache_path, shared_objects=False)
+        if repo.git.version_info < commit_report.COMMIT_GRAPH_GIT_VERSION:
+            self.skipTest('git is too old to write split commit-graphs')
+        chain = os.path.join(self.cache_path, 'objects', 'info', 'commit-graphs', 'commit-graph-chain')
+        with open(chain) as chain_file:
+            self.assertEqual(len(chain_file.readlines()), 1)
+        self.assertEqual(repo.git.config('core.commitGraph'), 'true')
+        commit_report.refresh_repo(path=self.cache_path)
+        repo.git.commit_graph('verify')
+
+    def test_shared_objects(self):
+        repo = commit_report.clone_repo(url=self.remote_repo, cache_path=self.cache_path)
+        store = commit_report.shared_store(repo)
+        self.assertEqual(os.path.dirname(store), os.path.abspath(commit_report.DEFAULT_SHARED_OBJECTS_DIR))
+        # Every object was handed to the store, which keeps the repo's refs
+        self.assertIn('count: 0\nsize: 0\nin-pack: 0\n', repo.git.count_objects('-v') + '\n')
+        self.assertEqual(repo.commit(self.commit_end).hexsha, self.commit_end)
+        member_refs = commit_report.SHARED_REFS_PREFIX + os.path.basename(self.cache_path) + '/heads/master'
+        self.assertEqual(Repo(store).git.rev_parse(member_refs), repo.git.rev_parse('master'))
+
+        # A mirror of the same repo uses the same store and brings nothing of its own
+        mirror = 'git@git-server:./test.git'
+        mirror_path = commit_report.create_cache_path(mirror)
+        self.addCleanup(shutil.rmtree, mirror_path, True)
+        mirror_repo = commit_report.clone_repo(url=mirror, cache_path=mirror_path)
+        self.assertEqual(commit_report.shared_store(mirror_repo), store)
+        commit_report.refresh_repo(path=mirror_path)
+        self.assertIn('count: 0\nsize: 0\nin-pack: 0\n', mirror_repo.git.count_objects('-v') + '\n')
+        self.assertEqual(mirror_repo.commit(self.commit_end).hexsha, self.commit_end)
+        if repo.git.version_info >= commit_report.COMMIT_GRAPH_GIT_VERSION:
+            Repo(store).git.commit_graph('verify')
+        # Packs of a partial clone, with blobs which were never fetched, can be repacked
+        self.assertTrue(commit_report.repack_shared_store(Repo(store), pack_limit=0))
+        # Without a remote to fetch from the store is no partial clone once repacked
+        self.assertEqual(Repo(store).git.config('--get', 'extensions.partialClone', with_exceptions=False), '')
+        self.assertEqual(mirror_repo.commit(self.commit_end).hexsha, self.commit_end)
+        self.assertEqual(len(list(commit_report.iter_commits_git_log(
+            mirror_repo, commit_report.commit_range(self.commit_start, self.commit_end)))), 6)
+
+        # Remotes without any commit in common get a store of their own
+        with tempfile.TemporaryDirectory() as tmp:
+            other = Repo.init(os.path.join(tmp, 'other'), bare=True)
+            # Having the objects is not enough, only the refs of the store's members are compared
+            with open(os.path.join(other.git_dir, 'objects', 'info', 'alternates'), 'w') as alternates:
+                alternates.write(os.path.join(os.path.abspath(store), 'objects') + '\n')
+            self.assertEqual(other.commit(self.commit_end).hexsha, self.commit_end)
+            path = commit_report.find_shared_store(self.remote_repo, stores_dir=tmp)
+            self.assertEqual(path, os.path.join(tmp, os.path.basename(self.cache_path)))
+
+    def test_repack_shared_store(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = Repo.init(os.path.join(tmp, 'store'), bare=True)
+            member = Repo.init(os.path.join(tmp, 'member'), bare=True)
+            with open(os.path.join(member.git_dir, 'objects', 'info', 'alternates'), 'w') as alternates:
+                alternates.write(os.path.join(store.git_dir, 'objects') + '\n')
+            parents = []
+            with patch('commit_report.repack_shared_store', wraps=commit_report.repack_shared_store) as patched:
+                for index in range(3):
+                    # Each fetch leaves a pack of its own in the store
+                    sha = make_commit(member, 'Commit {}'.format(index), *parents)
+                    parents = [sha]
+                    member.git.update_ref('refs/heads/master', sha)
+                    member.git.repack('-q')
+                    commit_report.share_objects(member, store.git_dir, 'member')
+                self.assertEqual(patched.call_count, 3)
+            pack_dir = os.path.join(store.git_dir, 'objects', 'pack')
+            self.assertEqual(len([name for name in os.listdir(pack_dir) if name.endswith('.pack')]), 3)
+
+            self.assertFalse(commit_report.repack_shared_store(store, pack_limit=3))
+            self.assertTrue(commit_report.repack_shared_store(store, pack_limit=2))
+            self.assertEqual(len([name for name in os.listdir(pack_dir) if name.endswith('.pack')]), 1)
+            # Every commit is still there
+            self.assertEqual(len(store.git.rev_list('refs/members/member/heads/master').splitlines()), 3)
+            self.assertEqual(store.git.config('--get', 'extensions.partialClone', with_exceptions=False), '')
+            commit_report.close_repo(store)
+            commit_report.close_repo(member)
+
+    def test_targeted_refspecs(self):
+        repo = commit_report.clone_repo(url=self.remote_repo, cache_path=self.cache_path)
+        self.assertEqual(commit_report.targeted_refspecs(repo, [self.commit_start, 'origin/master~2']),
+                         [self.commit_start, '+refs/heads/master:refs/heads/master',
+                          '+refs/heads/master:refs/remotes/origin/master'])
+        self.assertIsNone(commit_report.targeted_refspecs(repo, ['HEAD']))
+        self.assertIsNone(commit_report.targeted_refspecs(repo, ['no-such-branch']))
+
+    def test_refresh_repo_targeted(self):
+        commit_report.clone_repo(url=self.remote_repo, cache_path=self.cache_path)
+        with patch('git.Remote.update') as patched:
+            commit_report.refresh_repo(path=self.cache_path, revs=[self.commit_start, 'master'])
+            self.assertEqual(patched.call_count, 0)
+        self.assertTrue(os.path.exists(self.cache_path + '/FETCH_HEAD'))
+        # Only the branch fetched is recorded as current
+        self.assertEqual(sorted(commit_report.read_fetch_ref_stamps(Repo(self.cache_path))), ['master'])
+
+    def test_refresh_repo_timeout(self):
+        repo = commit_report.clone_repo(url=self.remote_repo, cache_path=self.cache_path)
+        # Make the remote hang without answering
+        repo.git.config('remote.origin.uploadpack', 'exec sleep 10 #')
+        started = time.time()
+        with self.assertRaises(commit_report.FetchTimeout):
+            commit_report.refresh_repo(path=self.cache_path, revs=['master'], timeout=0.5)
+        self.assertLess(time.time() - started, 5)
+
+    def test_get_repo_stale_on_timeout(self):
+        repo = commit_report.clone_repo(url=self.remote_repo, cache_path=self.cache_path)
+        repo.git.config('remote.origin.uploadpack', 'exec sleep 10 #')
+        repo = commit_report.get_repo(self.remote_repo, revs=['master'], fetch_timeout=0.5)
+        self.assertEqual(repo.commit(self.commit_end).hexsha, self.commit_end)
+        self.assertIn('using the cached copy instead', sys.stderr.getvalue())
 
     def test_do_it(self):
         self.maxDiff = None
@@ -125,11 +357,343 @@ class TestRepo(unittest.TestCase):
         output = sys.stdout.getvalue()
         self.assertEqual(output.lstrip(), textwrap.dedent(expected_output))
 
+    def test_backends_identical(self):
+        outputs = []
+        for backend in sorted(commit_report.COMMIT_BACKENDS):
+            args = ('--json', '--issue-links', '--backend', backend, '--no-metadata-cache',
+                    self.local_repo, self.commit_start, self.commit_end)
+            commit_report.do_it(args)
+            outputs.append(sys.stdout.getvalue())
+            sys.stdout.seek(0)
+            sys.stdout.truncate()
+        self.assertEqual(len(json.loads(outputs[0])), 6)
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_rev_filter_args(self):
+        self.assertEqual(commit_report.rev_filter_args('a...b'), ['a...b'])
+        rev_filter = commit_report.RevFilter(paths=('docs/', 'setup.py'), authors=('Tim',), grep=('SWTI',),
+                                             merges=False)
+        self.assertEqual(commit_report.rev_filter_args('a...b', rev_filter),
+                         ['--author=Tim', '--grep=SWTI', '--no-merges', 'a...b', '--', 'docs/', 'setup.py'])
+        self.assertEqual(commit_report.rev_filter_args('a...b', commit_report.RevFilter(merges=True), True),
+                         ['--merges', '--end-of-options', 'a...b'])
+
+    def test_rev_not_an_option(self):
+        repo = commit_report.get_repo(self.local_repo)
+        if not commit_report.supports_end_of_options(repo):
+            self.skipTest('git is too old for --end-of-options')
+        with tempfile.TemporaryDirectory() as tmp:
+            rev = '--output=' + os.path.join(tmp, 'out')
+            for backend in sorted(commit_report.COMMIT_BACKENDS):
+                with self.assertRaises(Exception):
+                    list(commit_report.COMMIT_BACKENDS[backend](repo, rev))
+            with self.assertRaises(Exception):
+                list(commit_report.iter_range_shas(repo, rev))
+            self.assertEqual(os.listdir(tmp), [])
+
+    def test_backends_filtered(self):
+        repo = commit_report.get_repo(self.local_repo)
+        rev = commit_report.commit_range(self.commit_start, self.commit_end)
+        for rev_filter, count in ((commit_report.RevFilter(paths=('.text.swp',)), 1),
+                                  (commit_report.RevFilter(grep=('SWTI',)), 3),
+                                  (commit_report.RevFilter(authors=('Nobody',)), 0),
+                                  (commit_report.RevFilter(merges=True), 0),
+                                  (commit_report.RevFilter(merges=False), 6)):
+            shas = list(commit_report.iter_range_shas(repo, rev, rev_filter))
+            self.assertEqual(len(shas), count, rev_filter)
+            for backend in sorted(commit_report.COMMIT_BACKENDS):
+                commits = list(commit_report.COMMIT_BACKENDS[backend](repo, rev, rev_filter))
+                self.assertEqual([commit.binsha for commit in commits], shas, (backend, rev_filter))
+
+    def test_do_it_filtered(self):
+        outputs = []
+        for args in ((), ('--metadata-cache',), ('--jobs', '2', '--metadata-cache'), ('--incremental',)):
+            commit_report.do_it(('--json', '--grep', 'SWTI') + args + (self.local_repo, self.commit_start,
+                                                                         self.commit_end))
+            outputs.append(sys.stdout.getvalue())
+            sys.stdout.seek(0)
+            sys.stdout.truncate()
+        self.assertEqual(len(json.loads(outputs[0])), 3)
+        for output in outputs[1:]:
+            self.assertEqual(output, outputs[0])
+
+    def test_parallel_identical(self):
+        outputs = []
+        for args in ((), ('--jobs', '2', '--metadata-cache'), ('--jobs', '3')):
+            commit_report.do_it(('--json', '--issue-links') + args +
+                                (self.local_repo, self.commit_start, self.commit_end))
+            outputs.append(sys.stdout.getvalue())
+            sys.stdout.seek(0)
+            sys.stdout.truncate()
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0], outputs[2])
+
+    def test_load_commits(self):
+        repo = commit_report.get_repo(self.local_repo)
+        expected = list(commit_report.iter_commits_git_log(repo, commit_report.commit_range(self.commit_start,
+                                                                                          self.commit_end)))
+        binshas = [raw.binsha for raw in reversed(expected)]
+        for loader in sorted(commit_report.COMMIT_LOADERS):
+            commits = list(commit_report.COMMIT_LOADERS[loader](repo, binshas))
+            self.assertEqual([raw.binsha for raw in commits], binshas, loader)
+            self.assertEqual([raw.authored_date for raw in commits], [raw.authored_date for raw in reversed(expected)])
+
+    def test_process_commits_parallel_order(self):
+        repo = commit_report.get_repo(self.local_repo)
+        binshas = list(commit_report.iter_range_shas(repo, commit_report.commit_range(self.commit_start,
+                                                                                      self.commit_end)))
+        with patch('commit_report.MIN_CHUNK_SIZE', 1), patch('commit_report.MAX_CHUNK_SIZE', 2):
+            records = list(commit_report.process_commits_parallel(repo, binshas, 2, include_links=True))
+        self.assertEqual([record.binsha for record in records], binshas)
+        self.assertEqual([issue.id for issue in records[2].issues], ['swti-23'])
+
+    def test_parse_git_log_record(self):
+        raw = commit_report.parse_git_log_record([b'06b0bb0d68514272fbe6a4c081b00fae364ccbb5', b'Tim Laurence',
+                                                  b'1493704132 -0400', b'Test 6.1\nTest 6.2\n'])
+        self.assertEqual(raw.binsha.hex(), '06b0bb0d68514272fbe6a4c081b00fae364ccbb5')
+        self.assertEqual(raw.author_tz_offset, 14400)
+        self.assertEqual(commit_report.format_timestamp(raw.authored_date, raw.author_tz_offset), '05/02/17 01:48:52')
+        raw = commit_report.parse_git_log_record([b'06b0bb0d68514272fbe6a4c081b00fae364ccbb5', b'Tim Laurence',
+                                                  b'1493704132 +0530', b''])
+        self.assertEqual(raw.author_tz_offset, -19800)
+
+    def test_do_it_timings(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            timings_file = os.path.join(tmp, 'timings.json')
+            profile_file = os.path.join(tmp, 'report.pstats')
+            args = ('--issue-links', '--timings-file', timings_file, '--profile', profile_file,
+                    self.local_repo, self.commit_start, self.commit_end)
+            commit_report.do_it(args)
+            with open(timings_file) as timings:
+                summary = json.load(timings)
+            self.assertTrue(os.path.getsize(profile_file) > 0)
+        self.assertEqual(sorted(summary['stages']), ['commit_processing', 'fetch', 'formatting', 'issue_extraction',
+                                                     'output', 'range_walk'])
+        self.assertEqual(summary['stages']['range_walk']['items'], 6)
+        self.assertEqual(summary['stages']['commit_processing']['items'], 6)
+        self.assertEqual(summary['stages']['output']['bytes'], len(sys.stdout.getvalue()))
+        self.assertTrue(summary['total_seconds'] >= sum(stage['seconds'] for stage in summary['stages'].values()))
+
+    def test_metadata_cache(self):
+        repo = commit_report.get_repo(self.local_repo)
+        rev = commit_report.commit_range(self.commit_start, self.commit_end)
+        expected = list(commit_report.iter_commits_git_log(repo, rev))
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = commit_report.open_metadata_cache(os.path.join(tmp, 'metadata.sqlite'))
+            self.assertEqual(list(commit_report.iter_commits_cached(repo, rev, 'git-log', cache)), expected)
+            with patch.dict(commit_report.COMMIT_LOADERS, {'git-log': None}):
+                # Every commit is cached now so the loader is never used
+                self.assertEqual(list(commit_report.iter_commits_cached(repo, rev, 'git-log', cache)), expected)
+            # The running total matches the commits stored
+            total = sum(len(raw.author) + len(raw.message) for raw in expected)
+            self.assertEqual(cache.execute('SELECT total FROM cache_size').fetchone()[0], total)
+            self.assertEqual(commit_report.trim_metadata_cache(cache, max_size=1), 0)
+            self.assertEqual(commit_report.trim_metadata_cache(cache, max_size=0), len(expected))
+            self.assertEqual(cache.execute('SELECT total FROM cache_size').fetchone()[0], 0)
+            cache.close()
+
+    def test_incremental(self):
+        repo = commit_report.get_repo(self.local_repo)
+        expected = list(commit_report.iter_commits_git_log(repo, commit_report.commit_range(self.commit_start,
+                                                                                          self.commit_end)))
+        walked = []
+
+        def records(commits):
+            # Checkpoints store what the backend handed out, bytes or text
+            return [commit_report.commit_to_dict(commit_report.process_raw_commit(raw, include_links=True), True,
+                                                 commit_report.DEFAULT_LINK_TEMPLATE) for raw in commits]
+
+        def walk(rev):
+            walked.append(rev)
+            return commit_report.iter_commits_git_log(repo, rev)
+
+        def report():
+            return commit_report.iter_commits_incremental(repo, self.local_repo, self.commit_start, self.commit_end,
+                                                          walk, path)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'checkpoints.sqlite')
+            # A checkpoint from when the range ended two commits earlier
+            old_end = expected[2].binsha.hex()
+            result = commit_report.iter_commits_incremental(repo, self.local_repo, self.commit_start, old_end, walk,
+                                                            path)
+            self.assertEqual(records(result), records(expected[2:]))
+            conn = commit_report.open_checkpoints(path)
+            with conn:
+                conn.execute('UPDATE checkpoints SET key = ?',
+                             (commit_report.checkpoint_key(self.local_repo, self.commit_start, self.commit_end),))
+            walked.clear()
+            self.assertEqual(records(report()), records(expected))
+            self.assertEqual(walked, [[self.commit_end, '^' + old_end, '^' + self.commit_start]])
+            self.assertEqual(conn.execute('SELECT end_sha FROM checkpoints').fetchall(), [(self.commit_end,)])
+
+            # Nothing new, nothing is walked
+            walked.clear()
+            self.assertEqual(records(report()), records(expected))
+            self.assertEqual(walked, [])
+
+            # A checkpoint that does not lead to the new end means a full walk, which replaces it
+            walked.clear()
+            with conn:
+                conn.execute('UPDATE checkpoints SET end_sha = ?', ('0' * 40,))
+            self.assertEqual(records(report()), records(expected))
+            self.assertEqual(walked, [commit_report.commit_range(self.commit_start, self.commit_end)])
+            self.assertEqual(conn.execute('SELECT end_sha FROM checkpoints').fetchall(), [(self.commit_end,)])
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM checkpoint_commits').fetchone()[0], len(expected))
+
+            # A report stopped part way leaves the stored checkpoint as it was
+            with conn:
+                conn.execute('UPDATE checkpoints SET end_sha = ?', ('0' * 40,))
+            result = report()
+            next(result)
+            result.close()
+            self.assertEqual(conn.execute('SELECT end_sha FROM checkpoints').fetchall(), [('0' * 40,)])
+            self.assertEqual(conn.execute('SELECT COUNT(*) FROM checkpoint_commits').fetchone()[0], len(expected))
+            conn.close()
+
+    def test_incremental_merge(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            repo = Repo.init(os.path.join(tmp, 'repo'), bare=True)
+            path = os.path.join(tmp, 'checkpoints.sqlite')
+
+            def walk(rev):
+                return commit_report.iter_commits_git_log(repo, rev)
+
+            def report():
+                commits = commit_report.iter_commits_incremental(repo, 'repo', start, 'master', walk, path)
+                return [raw.binsha.hex() for raw in commits]
+
+            start = make_commit(repo, 'start', day=1)
+            a = make_commit(repo, 'A', start, day=2)
+            b = make_commit(repo, 'B', start, day=3)
+            c = make_commit(repo, 'C', a, day=5)
+            repo.git.update_ref('refs/heads/master', c)
+            self.assertEqual(report(), [c, a])
+
+            # The side branch brings in a commit older than the checkpoint's end
+            m = make_commit(repo, 'M', c, b, day=6)
+            repo.git.update_ref('refs/heads/master', m)
+            full = [raw.binsha.hex() for raw in walk(commit_report.commit_range(start, m))]
+            self.assertEqual(full, [m, c, b, a])
+            self.assertEqual(report(), full)
+
+            # Again, on top of commits added by the last run
+            d = make_commit(repo, 'D', b, day=4)
+            n = make_commit(repo, 'N', m, d, day=7)
+            repo.git.update_ref('refs/heads/master', n)
+            full = [raw.binsha.hex() for raw in walk(commit_report.commit_range(start, n))]
+            self.assertEqual(full, [n, m, c, d, b, a])
+            self.assertEqual(report(), full)
+            commit_report.close_repo(repo)
+
+    def test_incremental_paths(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            repo = Repo.init(os.path.join(tmp, 'repo'), bare=True)
+            path = os.path.join(tmp, 'checkpoints.sqlite')
+            rev_filter = commit_report.RevFilter(paths=('p',))
+
+            def walk(rev):
+                return commit_report.iter_commits_git_log(repo, rev, rev_filter)
+
+            def report():
+                commits = commit_report.iter_commits_incremental(repo, 'repo', start, 'master', walk, path,
+                                                                 rev_filter)
+                return [raw.binsha.hex() for raw in commits]
+
+            start = make_commit(repo, 'start', day=1, tree=make_tree(repo, {'p': '0', 'q': '0'}))
+            a = make_commit(repo, 'A', start, day=2, tree=make_tree(repo, {'p': '0', 'q': '1'}))
+            y = make_commit(repo, 'Y', start, day=3, tree=make_tree(repo, {'p': '1', 'q': '0'}))
+            # M keeps A's p, so history simplification leaves out Y
+            m = make_commit(repo, 'M', a, y, day=4, tree=make_tree(repo, {'p': '0', 'q': '1'}))
+            repo.git.update_ref('refs/heads/master', m)
+            self.assertEqual(report(), [])
+
+            # N takes p from Z, a child of Y, and Y shows up again
+            z = make_commit(repo, 'Z', y, day=5, tree=make_tree(repo, {'p': '2', 'q': '0'}))
+            n = make_commit(repo, 'N', m, z, day=6, tree=make_tree(repo, {'p': '2', 'q': '1'}))
+            repo.git.update_ref('refs/heads/master', n)
+            full = [raw.binsha.hex() for raw in walk(commit_report.commit_range(start, n))]
+            self.assertEqual(full, [z, y])
+            self.assertEqual(report(), full)
+            commit_report.close_repo(repo)
+
+    def test_checkpoint_key_filtered(self):
+        key = commit_report.checkpoint_key(self.local_repo, 's', 'e')
+        self.assertEqual(commit_report.checkpoint_key(self.local_repo, 's', 'e', None), key)
+        filtered = commit_report.checkpoint_key(self.local_repo, 's', 'e', commit_report.RevFilter(paths=('docs/',)))
+        self.assertNotEqual(filtered, key)
+        self.assertNotEqual(commit_report.checkpoint_key(self.local_repo, 's', 'e',
+                                                         commit_report.RevFilter(authors=('docs/',))), filtered)
+
+    def test_batch(self):
+        jobs = [{'repo': self.remote_repo, 'start': self.commit_start, 'end': self.commit_end},
+                {'repo': self.remote_repo, 'start': self.commit_start, 'end': self.commit_end, 'format': 'json',
+                 'args': ['--issue-links']},
+                {'repo': self.local_repo, 'start': self.commit_start, 'end': self.commit_end, 'format': 'ndjson',
+                 'output': 'local.ndjson'}]
+        with tempfile.TemporaryDirectory() as tmp:
+            manifest = os.path.join(tmp, 'manifest.json')
+            with open(manifest, 'w') as manifest_file:
+                json.dump({'jobs': jobs}, manifest_file)
+            with patch('commit_report.get_repo', wraps=commit_report.get_repo) as patched:
+                commit_report.main(['batch', '--output-dir', tmp, '--workers', '2', manifest])
+                # Both remote jobs share a single fetch
+                self.assertEqual(patched.call_count, 1)
+
+            with open(os.path.join(tmp, 'summary.json')) as summary_file:
+                summary = json.load(summary_file)
+            self.assertEqual([job['status'] for job in summary], ['ok', 'ok', 'ok'])
+            with open(os.path.join(tmp, 'job-0.txt')) as report:
+                self.assertTrue(report.read().startswith('06b0bb0d68514272fbe6a4c081b00fae364ccbb5 Tim Laurence'))
+            with open(os.path.join(tmp, 'job-1.json')) as report:
+                self.assertEqual(len(json.load(report)), 6)
+            with open(os.path.join(tmp, 'local.ndjson')) as report:
+                self.assertEqual(len(report.readlines()), 6)
+
+    def test_batch_invalid_args(self):
+        jobs = [{'repo': self.local_repo, 'start': self.commit_start, 'end': self.commit_end, 'args': ['--bogus']},
+                {'repo': self.remote_repo, 'start': self.commit_start, 'end': self.commit_end, 'args': ['--bogus']},
+                {'repo': self.local_repo, 'start': self.commit_start, 'end': self.commit_end, 'format': 'json'}]
+        with tempfile.TemporaryDirectory() as tmp:
+            manifest = os.path.join(tmp, 'manifest.json')
+            with open(manifest, 'w') as manifest_file:
+                json.dump(jobs, manifest_file)
+            with patch('commit_report.get_repo', wraps=commit_report.get_repo) as patched:
+                with self.assertRaises(SystemExit) as raised:
+                    commit_report.main(['batch', '--output-dir', tmp, '--workers', '2', manifest])
+                # The remote is only used by the invalid job, it is not fetched
+                self.assertEqual(patched.call_count, 0)
+            self.assertEqual(raised.exception.code, 1)
+
+            with open(os.path.join(tmp, 'summary.json')) as summary_file:
+                summary = json.load(summary_file)
+            self.assertEqual([job['status'] for job in summary], ['error', 'error', 'ok'])
+            self.assertIn('--bogus', summary[0]['error'])
+            with open(os.path.join(tmp, 'job-2.json')) as report:
+                self.assertEqual(len(json.load(report)), 6)
+
+    def test_run_batch_job_invalid_args(self):
+        summary = commit_report.run_batch_job({'repo': self.local_repo, 'start': self.commit_start,
+                                               'end': self.commit_end, 'output': 'job-0.txt',
+                                               'args': ['--bogus', self.local_repo, self.commit_start,
+                                                        self.commit_end]}, 'reports')
+        self.assertEqual(summary['status'], 'error')
+        self.assertIn('unrecognized arguments: --bogus', summary['error'])
+
     def tearDown(self):
         try:
             shutil.rmtree(self.cache_path)
         except FileNotFoundError:
             pass
+        try:
+            os.remove(self.cache_path + '.lock')
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(commit_report.DEFAULT_SHARED_OBJECTS_DIR, ignore_errors=True)
+        try:
+            os.remove(commit_report.DEFAULT_SHARED_OBJECTS_DIR.rstrip('/') + '.lock')
+        except FileNotFoundError:
+            pass
 
 
 class TestOutput(unittest.TestCase):
@@ -205,22 +769,414 @@ class TestOutput(unittest.TestCase):
         out_obj = json.loads(output)
         self.assertDictEqual(out_obj[0], expected_output[0])
 
+    def test_json_stream(self):
+        output = ''.join(commit_report.stream_for_json(iter(self.commits), include_links=True))
+        self.assertEqual(output, commit_report.format_for_json(self.commits, include_links=True))
+        self.assertEqual(len(json.loads(output)), 4)
+        self.assertEqual(''.join(commit_report.stream_for_json(iter([]))), '[]')
+
+    def test_ndjson(self):
+        chunks = list(commit_report.stream_for_ndjson(iter(self.commits)))
+        self.assertEqual(len(chunks), 4)
+        self.assertDictEqual(json.loads(chunks[1]),
+                             {"id": "2d0c90f95a728acde5f180f8fef35d41b83d0601", "author": "John Doe",
+                              "timestamp": "04/03/17 23:38:25", "messages": "message1\nmessage"})
+
+    def test_human_stream_is_lazy(self):
+        def commits():
+            yield self.commits[0]
+            raise AssertionError('Formatter read past the first commit')
+
+        first = next(commit_report.stream_for_humans(commits()))
+        self.assertTrue(first.startswith('2d0c90f95a728acde5f180f8fef35d41b83d0600 John Doe'))
+
+
+@unittest.skipIf(importlib.util.find_spec('pyarrow') is None, 'pyarrow is not installed')
+class TestArrow(unittest.TestCase):
+    def setUp(self):
+        isolate_caches(self)
+        issue = commit_report.IssueData(id='swti-1', display='[SWTI-1]')
+        self.commits = [commit_report.CommitRecord(bytes([x]) * 20, 'John Doe' if x % 2 else 'Jane Doe',
+                                                   1491262705 + x, 14400, 'message{}\n'.format(x), (issue,) * (x % 2))
+                        for x in range(5)]
+
+    def read(self, chunks):
+        return commit_report.import_pyarrow().ipc.open_stream(b''.join(chunks)).read_all()
+
+    def test_arrow(self):
+        chunks = list(commit_report.stream_for_arrow(self.commits, True, batch_size=2))
+        # Written as each full batch is ready, the last one together with the end of stream marker
+        self.assertEqual(len(chunks), 3)
+        table = self.read(chunks)
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(table.column('id').to_pylist(), [bytes([x]) * 20 for x in range(5)])
+        self.assertEqual(table.column('author').to_pylist(), ['Jane Doe', 'John Doe'] * 2 + ['Jane Doe'])
+        self.assertEqual(table.column('issues').to_pylist()[:2], [[], ['swti-1']])
+        self.assertEqual(table.column('issue_links').to_pylist()[1], ['[SWTI-1] : https://jira.com/browse/swti-1'])
+        self.assertEqual(table.column('author_tz_offset').to_pylist(), [14400] * 5)
+
+    def test_empty(self):
+        table = self.read(commit_report.stream_for_arrow([]))
+        self.assertEqual(table.num_rows, 0)
+        self.assertEqual(table.schema, commit_report.arrow_schema())
+
+    def test_generate_report(self):
+        for jobs in ('1', '2'):
+            parsed_args = commit_report.parse_args(('--arrow', '--no-metadata-cache', '--jobs', jobs, 'test/test.git',
+                                                    '9c83a8a26c3bcd517d310b1a2a4d0a48a1af2ada',
+                                                    '06b0bb0d68514272fbe6a4c081b00fae364ccbb5'))
+            out = io.BytesIO()
+            written = commit_report.generate_report(commit_report.get_report_repo(parsed_args), parsed_args, out)
+            self.assertEqual(written, len(out.getvalue()))
+            table = self.read([out.getvalue()])
+            self.assertEqual(table.num_rows, 6)
+            # Issues are matched without --issue-links, the column is there to be queried
+            self.assertIn(['swti-23'], table.column('issues').to_pylist())
+
+
+class TestSummaries(unittest.TestCase):
+    def setUp(self):
+        isolate_caches(self)
+        swti = commit_report.IssueData(id='swti-1', display='[SWTI-1]')
+        other = commit_report.IssueData(id='1', display='Bug 1', link_template='https://bugs/{id}')
+        self.commits = [
+            commit_report.CommitRecord(b'\x03' * 20, 'John Doe', 1491262705, 0, 'Three', (swti, swti)),
+            commit_report.CommitRecord(b'\x02' * 20, 'Jane Doe', 1491262605, 0, 'Two', (swti, other)),
+            commit_report.CommitRecord(b'\x01' * 20, 'John Doe', 1491262505, 0, 'One', ()),
+        ]
+
+    def test_by_issue(self):
+        summaries = commit_report.summarize_by_issue(self.commits, include_links=True)
+        self.assertEqual(summaries, [
+            {'issue': 'swti-1', 'display': '[SWTI-1]', 'commits': 2, 'authors': ['John Doe', 'Jane Doe'],
+             'first': '04/03/17 23:36:45', 'last': '04/03/17 23:38:25',
+             'link': '[SWTI-1] : https://jira.com/browse/swti-1'},
+            {'issue': '1', 'display': 'Bug 1', 'commits': 1, 'authors': ['Jane Doe'],
+             'first': '04/03/17 23:36:45', 'last': '04/03/17 23:36:45', 'link': 'https://bugs/1'}])
+
+    def test_by_author(self):
+        summaries = commit_report.summarize_by_author(self.commits)
+        self.assertEqual(summaries, [
+            {'author': 'John Doe', 'commits': 2, 'issues': ['[SWTI-1]'],
+             'first': '04/03/17 23:35:05', 'last': '04/03/17 23:38:25'},
+            {'author': 'Jane Doe', 'commits': 1, 'issues': ['[SWTI-1]', 'Bug 1'],
+             'first': '04/03/17 23:36:45', 'last': '04/03/17 23:36:45'}])
+
+    def test_human(self):
+        summaries = commit_report.summarize_by_issue(self.commits)
+        output = ''.join(commit_report.stream_summaries_for_humans(summaries))
+        self.assertEqual(output.splitlines(), [
+            '[SWTI-1]                                      2 commits 04/03/17 23:36:45 - 04/03/17 23:38:25',
+            '    Authors: John Doe, Jane Doe',
+            '',
+            'Bug 1                                         1 commits 04/03/17 23:36:45 - 04/03/17 23:36:45',
+            '    Authors: Jane Doe'])
+
+    def test_do_it(self):
+        commit_report.do_it(('--json', '--group-by', 'issue', '--no-metadata-cache', 'test/test.git',
+                             '9c83a8a26c3bcd517d310b1a2a4d0a48a1af2ada', '06b0bb0d68514272fbe6a4c081b00fae364ccbb5'))
+        summaries = json.loads(sys.stdout.getvalue())
+        self.assertEqual([(summary['issue'], summary['commits']) for summary in summaries],
+                         [('swti-23', 2), ('swti-20', 1), ('swti-21', 1), ('swti-22', 1)])
+        self.assertNotIn('link', summaries[0])
+
+
+class TestCommitRecord(unittest.TestCase):
+    def setUp(self):
+        self.raw = commit_report.RawCommit(binsha=bytes.fromhex('06b0bb0d68514272fbe6a4c081b00fae364ccbb5'),
+                                           author=b'Tim Laurence', authored_date=1493704132, author_tz_offset=14400,
+                                           message=b'Test [SWTI-23] 6.1\nTest 6.2\n')
+
+    def test_lazy_fields(self):
+        record = commit_report.process_raw_commit(self.raw, include_links=False)
+        self.assertFalse(hasattr(record, '__dict__'))
+        self.assertEqual(record.message_raw, self.raw.message)
+        self.assertEqual(record.id, '06b0bb0d68514272fbe6a4c081b00fae364ccbb5')
+        self.assertEqual(record.author, 'Tim Laurence')
+        self.assertEqual(record.timestamp, '05/02/17 01:48:52')
+        self.assertEqual(record.messages, 'Test [SWTI-23] 6.1\nTest 6.2\n')
+        self.assertEqual(record.issues, ())
+
+    def test_issues(self):
+        record = commit_report.process_raw_commit(self.raw, include_links=True)
+        self.assertEqual(record.issues, (commit_report.IssueData(id='swti-23', display='[SWTI-23]'),))
+
+    def test_same_output_as_commit_data(self):
+        record = commit_report.process_raw_commit(self.raw, include_links=True)
+        data = commit_report.CommitData(id=record.id, author=record.author, timestamp=record.timestamp,
+                                        messages=record.messages, issues=list(record.issues))
+        self.assertEqual(commit_report.format_for_humans([record], include_links=True),
+                         commit_report.format_for_humans([data], include_links=True))
+        self.assertEqual(commit_report.format_for_json([record], include_links=True),
+                         commit_report.format_for_json([data], include_links=True))
+
+
+class TestStageTimer(unittest.TestCase):
+    def test_nested_stages_are_exclusive(self):
+        timer = commit_report.StageTimer()
+        with timer.stage('outer'):
+            time.sleep(0.05)
+            with timer.stage('inner'):
+                time.sleep(0.1)
+        stages = timer.summary()['stages']
+        self.assertTrue(0.05 <= stages['outer']['seconds'] < 0.1)
+        self.assertTrue(stages['inner']['seconds'] >= 0.1)
+
+    def test_iterate(self):
+        timer = commit_report.StageTimer()
+        items = list(timer.iterate('items', ['ab', 'cde'], size=len))
+        self.assertEqual(items, ['ab', 'cde'])
+        self.assertEqual(timer.stages['items']['items'], 2)
+        self.assertEqual(timer.stages['items']['bytes'], 5)
+
+
+class TestIssueMatcher(unittest.TestCase):
+    def setUp(self):
+        self.matcher = commit_report.build_issue_matcher(
+            issue_trackers=[('github', r'(?P<display>#(?P<id>\d+))', 'https://github.com/org/repo/issues/{id}'),
+                            ('servicenow', r'(?P<display>(?P<id>INC\d{7}))', 'https://sn.example.com/{id}')])
+
+    def test_prefilter(self):
+        self.assertEqual(commit_report.issue_prefilter(commit_report.DEFAULT_ISSUE_ID_MATCHER), '[')
+        self.assertEqual(commit_report.issue_prefilter(r'(?P<display>(?P<id>INC\d{7}))'), 'INC')
+        self.assertIsNone(commit_report.issue_prefilter(r'(?i)(?P<display>(?P<id>inc\d+))'))
+        self.assertIsNone(commit_report.issue_prefilter(r'(?P<display>(?P<id>\d+))'))
+
+    def test_compiled_once(self):
+        self.assertIs(commit_report.build_issue_matcher(), commit_report.build_issue_matcher())
+
+    def test_multiple_trackers(self):
+        issues = commit_report.find_issues(self.matcher, 'Fix #12 for [SWTI-23] and INC0001234')
+        self.assertEqual([issue.id for issue in issues], ['12', 'swti-23', 'inc0001234'])
+        self.assertEqual(commit_report.generate_link_list(commit_report.DEFAULT_LINK_TEMPLATE, issues),
+                         ['https://github.com/org/repo/issues/12',
+                          '[SWTI-23] : https://jira.com/browse/swti-23',
+                          'https://sn.example.com/inc0001234'])
+
+    def test_no_prefilter_match(self):
+        self.assertEqual(commit_report.find_issues(self.matcher, 'Nothing to see here'), [])
+
+    def test_uncombinable_trackers(self):
+        matcher = commit_report.build_issue_matcher(
+            issue_trackers=[('upper', r'(?i)(?P<display>(?P<id>inc\d+))', '{id}')])
+        issues = commit_report.find_issues(matcher, 'INC12 then [ABC-1]')
+        self.assertEqual([issue.display for issue in issues], ['INC12', '[ABC-1]'])
+
+
+class TestBatch(unittest.TestCase):
+    def test_load_manifest(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            manifest = os.path.join(tmp, 'manifest.json')
+            with open(manifest, 'w') as manifest_file:
+                json.dump([{'repo': 'r', 'start': 's', 'end': 'e', 'format': 'json', 'args': ['--issue-links']}],
+                          manifest_file)
+            jobs = commit_report.load_manifest(manifest)
+        self.assertEqual(jobs[0]['output'], 'job-0.json')
+        self.assertEqual(jobs[0]['args'], ['--json', '--issue-links', 'r', 's', 'e'])
+
+    def test_load_manifest_bad_format(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            manifest = os.path.join(tmp, 'manifest.json')
+            with open(manifest, 'w') as manifest_file:
+                json.dump([{'repo': 'r', 'start': 's', 'end': 'e', 'format': 'xml'}], manifest_file)
+            self.assertRaises(ValueError, commit_report.load_manifest, manifest)
+
+
+class TestServe(unittest.TestCase):
+    def setUp(self):
+        isolate_caches(self)
+        self.server = commit_report.create_server(commit_report.parse_serve_args(['--port', '0', '--pool-size', '1']))
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.url = 'http://127.0.0.1:{}/report'.format(self.server.server_address[1])
+
+    def test_report(self):
+        commit_report.do_it(('--json', '--issue-links', 'test/test.git', '9c83a8a26c3bcd517d310b1a2a4d0a48a1af2ada',
+                             '06b0bb0d68514272fbe6a4c081b00fae364ccbb5'))
+        expected = sys.stdout.getvalue()
+        url = self.url + '?repo=test/test.git&start=9c83a8a26c3bcd517d310b1a2a4d0a48a1af2ada' \
+                         '&end=06b0bb0d68514272fbe6a4c081b00fae364ccbb5&format=json&links=1'
+        for _ in range(2):
+            with urlopen(url) as response:
+                self.assertEqual(response.headers['Content-Type'], 'application/json')
+                self.assertEqual(response.read().decode('utf-8'), expected)
+        self.assertEqual(list(self.server.pool.repos), ['test/test.git'])
+
+    def test_bad_request(self):
+        with self.assertRaises(Exception) as raised:
+            urlopen(self.url + '?repo=test/test.git&format=xml')
+        self.assertEqual(raised.exception.code, 400)
+
+    def test_unknown_revision(self):
+        with self.assertRaises(Exception) as raised:
+            urlopen(self.url + '?repo=test/test.git&start=nosuch&end=HEAD')
+        self.assertEqual(raised.exception.code, 404)
+        self.assertEqual(raised.exception.reason, 'Unknown revision')
+        self.assertIn('nosuch', raised.exception.read().decode('utf-8'))
+
+    def test_repo_error(self):
+        with patch.object(self.server.pool, 'get', side_effect=Exception('fatal: first line\nsecond line')):
+            with self.assertRaises(Exception) as raised:
+                urlopen(self.url + '?repo=test/test.git&start=a&end=b')
+        self.assertEqual(raised.exception.code, 500)
+        self.assertEqual(raised.exception.reason, 'Could not get the repo')
+        self.assertIn('second line', raised.exception.read().decode('utf-8'))
+
+    def test_option_injection(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for query in ('?repo=test/test.git&arg=--&start=--output={}&end=HEAD',
+                          '?repo=test/test.git&start=--output={}&end=HEAD',
+                          '?repo=test/test.git&start=HEAD~1&end=--output={}'):
+                with self.assertRaises(Exception) as raised:
+                    urlopen(self.url + query.format(os.path.join(tmp, 'out')))
+                self.assertEqual(raised.exception.code, 400)
+            self.assertEqual(os.listdir(tmp), [])
+
+    def test_pool_coalesces_refreshes(self):
+        calls = []
+
+        def slow_get_report_repo(parsed_args, revs=None):
+            calls.append(sorted(set(revs)))
+            time.sleep(0.2)
+            return Repo('test/test.git')
+
+        pool = commit_report.RepoPool(fetch_workers=1)
+        with patch('commit_report.get_report_repo', slow_get_report_repo):
+            # The only fetch slot is taken, every request arrives before the refresh starts
+            with pool.fetch_slots:
+                threads = [threading.Thread(target=pool.get,
+                                            args=(commit_report.parse_args(('test/test.git', 'a', end)),))
+                           for end in 'bbcd']
+                for thread in threads:
+                    thread.start()
+                time.sleep(0.1)
+            for thread in threads:
+                thread.join()
+        pool.close()
+        # Requests for other ranges of the same remote share the fetch too
+        self.assertEqual(calls, [['a', 'b', 'c', 'd']])
+
+    def test_report_concurrent(self):
+        url = self.url + '?repo=test/test.git&start=9c83a8a26c3bcd517d310b1a2a4d0a48a1af2ada' \
+                         '&end=06b0bb0d68514272fbe6a4c081b00fae364ccbb5&format=ndjson'
+        with urlopen(url) as response:
+            response.read()
+        running = []
+        most = []
+
+        def slow_generate_report(repo, parsed_args, out):
+            running.append(parsed_args.backend)
+            most.append(len(running))
+            time.sleep(0.1)
+            running.remove(parsed_args.backend)
+
+        def fetch(backend):
+            with urlopen(url + '&arg=--backend&arg=' + backend) as response:
+                response.read()
+
+        with patch('commit_report.generate_report', slow_generate_report):
+            for backend, expected in (('git-log', 3), ('gitpython', 1)):
+                most.clear()
+                threads = [threading.Thread(target=fetch, args=(backend,)) for _ in range(3)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                # Only reports reading objects through the shared handle run one at a time
+                self.assertEqual(max(most), expected, backend)
+
+    def test_pool_limits_fetches(self):
+        running = []
+        most = []
+
+        def slow_get_report_repo(parsed_args, revs=None):
+            running.append(parsed_args.repo)
+            most.append(len(running))
+            time.sleep(0.1)
+            running.remove(parsed_args.repo)
+            return Repo('test/test.git')
+
+        pool = commit_report.RepoPool(fetch_workers=2)
+        with patch('commit_report.get_report_repo', slow_get_report_repo):
+            threads = [threading.Thread(target=pool.get, args=(commit_report.parse_args((repo, 'a', 'b')),))
+                       for repo in ('c.git', 'd.git', 'e.git', 'f.git', 'g.git')]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        pool.close()
+        self.assertEqual(len(most), 5)
+        self.assertEqual(max(most), 2)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.server.pool.close()
+
+
+class TestStartup(unittest.TestCase):
+    # Generous enough for slow machines, importing GitPython alone takes longer on most
+    STARTUP_BUDGET = 0.5  # Seconds
+    HEAVY_MODULES = ('git', 'pyarrow', 'sqlite3', 'multiprocessing', 'concurrent.futures', 'http.server', 'cProfile')
+
+    def run_python(self, code):
+        return subprocess.check_output([sys.executable, '-c', code], cwd=os.path.dirname(
+            os.path.abspath(commit_report.__file__))).decode('utf-8')
+
+    def test_heavy_modules_not_imported(self):
+        code = textwrap.dedent("""
+            import sys
+            import commit_report
+            try:
+                commit_report.parse_args(['--no-such-option', 'r', 's', 'e'])
+            except SystemExit:
+                pass
+            print(' '.join(name for name in {!r} if name in sys.modules))
+            """).format(self.HEAVY_MODULES)
+        self.assertEqual(self.run_python(code).strip(), '')
+
+    def test_startup_budget(self):
+        code = textwrap.dedent("""
+            import time
+            started = time.perf_counter()
+            import commit_report
+            commit_report.parse_args(['r', 's', 'e'])
+            print(time.perf_counter() - started)
+            """)
+        self.assertLess(float(self.run_python(code)), self.STARTUP_BUDGET)
+
+    def test_type_hints(self):
+        # Annotations name the lazily imported types, which type checkers import under TYPE_CHECKING
+        import git
+        import sqlite3
+        names = {'Repo': git.Repo, 'Commit': git.Commit, 'sqlite3': sqlite3}
+        for name, value in vars(commit_report).items():
+            if inspect.isfunction(value) and value.__module__ == commit_report.__name__:
+                typing.get_type_hints(value, localns=names)
+        self.assertIs(typing.get_type_hints(commit_report.get_repo, localns=names)['return'], git.Repo)
+
 
 class TestArgs(unittest.TestCase):
     def test_human_default(self):
         args = ('1', '2', '3')
         result = commit_report.parse_args(args=args)
-        self.assertEqual(result.formatter, commit_report.format_for_humans)
+        self.assertEqual(result.formatter, commit_report.stream_for_humans)
 
     def test_human_selected(self):
         args = ('--human', '1', '2', '3')
         result = commit_report.parse_args(args=args)
-        self.assertEqual(result.formatter, commit_report.format_for_humans)
+        self.assertEqual(result.formatter, commit_report.stream_for_humans)
 
     def test_json(self):
         args = ('--json', '1', '2', '3')
         result = commit_report.parse_args(args=args)
-        self.assertEqual(result.formatter, commit_report.format_for_json)
+        self.assertEqual(result.formatter, commit_report.stream_for_json)
+
+    def test_ndjson(self):
+        args = ('--ndjson', '1', '2', '3')
+        result = commit_report.parse_args(args=args)
+        self.assertEqual(result.formatter, commit_report.stream_for_ndjson)
 
     def test_issue_links_unselected(self):
         args = ('1', '2', '3')
@@ -232,6 +1188,80 @@ class TestArgs(unittest.TestCase):
         result = commit_report.parse_args(args=args)
         self.assertEqual(result.links, True)
 
+    def test_backend_default(self):
+        args = ('r', 's', 'e')
+        result = commit_report.parse_args(args=args)
+        self.assertEqual(result.backend, commit_report.DEFAULT_BACKEND)
+
+    def test_backend_set(self):
+        args = ('--backend', 'gitpython', 'r', 's', 'e')
+        result = commit_report.parse_args(args=args)
+        self.assertEqual(result.backend, 'gitpython')
+
+    def test_metadata_cache_default(self):
+        args = ('r', 's', 'e')
+        result = commit_report.parse_args(args=args)
+        self.assertEqual(result.metadata_cache, None)
+        self.assertEqual(result.metadata_cache_size, commit_report.DEFAULT_METADATA_CACHE_SIZE)
+        # Only the gitpython backend is faster with the cache
+        self.assertFalse(commit_report.use_metadata_cache(result))
+        result = commit_report.parse_args(args=('--backend', 'gitpython', 'r', 's', 'e'))
+        self.assertTrue(commit_report.use_metadata_cache(result))
+        result = commit_report.parse_args(args=('--metadata-cache', 'r', 's', 'e'))
+        self.assertTrue(commit_report.use_metadata_cache(result))
+
+    def test_metadata_cache_disabled(self):
+        args = ('--no-metadata-cache', '--metadata-cache-size', '5', 'r', 's', 'e')
+        result = commit_report.parse_args(args=args)
+        self.assertEqual(result.metadata_cache, False)
+        self.assertEqual(result.metadata_cache_size, 5)
+        result = commit_report.parse_args(args=('--backend', 'gitpython', '--no-metadata-cache', 'r', 's', 'e'))
+        self.assertFalse(commit_report.use_metadata_cache(result))
+
+    def test_group_by(self):
+        result = commit_report.parse_args(args=('r', 's', 'e'))
+        self.assertEqual(result.group_by, 'commit')
+        result = commit_report.parse_args(args=('--group-by', 'author', 'r', 's', 'e'))
+        self.assertEqual(result.group_by, 'author')
+        with self.assertRaises(SystemExit):
+            commit_report.parse_args(args=('--arrow', '--group-by', 'author', 'r', 's', 'e'))
+
+    def test_arrow(self):
+        args = ('--arrow', 'r', 's', 'e')
+        result = commit_report.parse_args(args=args)
+        self.assertEqual(result.formatter, commit_report.stream_for_arrow)
+
+    def test_fetch_timeout(self):
+        result = commit_report.parse_args(args=('r', 's', 'e'))
+        self.assertEqual(result.fetch_timeout, commit_report.DEFAULT_FETCH_TIMEOUT)
+        result = commit_report.parse_args(args=('--fetch-timeout', '2.5', 'r', 's', 'e'))
+        self.assertEqual(result.fetch_timeout, 2.5)
+
+    def test_rev_filter(self):
+        result = commit_report.parse_args(args=('r', 's', 'e'))
+        self.assertEqual((result.paths, result.authors, result.grep, result.merges), ([], [], [], None))
+        self.assertIsNone(commit_report.report_rev_filter(result))
+        result = commit_report.parse_args(args=('--path', 'docs/', '--path', 'setup.py', '--author', 'Tim',
+                                                '--grep', 'SWTI', '--no-merges', 'r', 's', 'e'))
+        self.assertEqual(commit_report.report_rev_filter(result),
+                         commit_report.RevFilter(('docs/', 'setup.py'), ('Tim',), ('SWTI',), False))
+        result = commit_report.parse_args(args=('--merges', 'r', 's', 'e'))
+        self.assertEqual(result.merges, True)
+        with self.assertRaises(SystemExit):
+            commit_report.parse_args(args=('--merges', '--no-merges', 'r', 's', 'e'))
+
+    def test_jobs(self):
+        result = commit_report.parse_args(args=('r', 's', 'e'))
+        self.assertEqual(result.jobs, commit_report.DEFAULT_JOBS)
+        result = commit_report.parse_args(args=('--jobs', '4', 'r', 's', 'e'))
+        self.assertEqual(result.jobs, 4)
+
+    def test_incremental(self):
+        result = commit_report.parse_args(args=('r', 's', 'e'))
+        self.assertEqual(result.incremental, False)
+        result = commit_report.parse_args(args=('--incremental', 'r', 's', 'e'))
+        self.assertEqual(result.incremental, True)
+
     def test_repo(self):
         args = ('r', 's', 'e')
         result = commit_report.parse_args(args=args)
@@ -267,6 +1297,27 @@ class TestArgs(unittest.TestCase):
         result = commit_report.parse_args(args=args)
         self.assertEqual(result.issue_id_regex, 'test')
 
+    def test_issue_trackers(self):
+        args = ('--issue-tracker', 'gh', r'#(?P<id>\d+)', '{id}', 'r', 's', 'e')
+        result = commit_report.parse_args(args=args)
+        self.assertEqual(result.issue_trackers, [['gh', r'#(?P<id>\d+)', '{id}']])
+
+    def test_clone_filter(self):
+        result = commit_report.parse_args(args=('r', 's', 'e'))
+        self.assertEqual(commit_report.clone_filter(result), commit_report.DEFAULT_CLONE_FILTER)
+        result = commit_report.parse_args(args=('--clone-filter', 'none', 'r', 's', 'e'))
+        self.assertIsNone(commit_report.clone_filter(result))
+
+    def test_shared_objects(self):
+        result = commit_report.parse_args(args=('r', 's', 'e'))
+        self.assertEqual(result.shared_objects, True)
+        result = commit_report.parse_args(args=('--no-shared-objects', 'r', 's', 'e'))
+        self.assertEqual(result.shared_objects, False)
+
+    def test_fetch_ttl(self):
+        result = commit_report.parse_args(args=('--fetch-ttl', '60', 'r', 's', 'e'))
+        self.assertEqual(result.fetch_ttl, 60)
+
     def test_arg_error_1(self):
         args = ()
         self.assertRaises(SystemExit, commit_report.parse_args, args)